@@ -1,15 +1,20 @@
 from typing import Any
 
+import torch
 from cyy_torch_toolbox.tensor import tensor_to
 from cyy_torch_toolbox.typing import TensorDict
 
-from ..message import DeltaParameterMessage, Message, ParameterMessage
+from ..message import (DeltaParameterMessage, MaskedParameterMessage, Message,
+                       ParameterMessage)
 
 
 class AggregationAlgorithm:
     def __init__(self) -> None:
         self._all_worker_data: dict[int, Message] = {}
         self._skipped_workers: set[int] = set()
+        # Rounds between the global model a worker trained on and the current one
+        self._staleness: dict[int, int] = {}
+        self.staleness_exponent: float = 0.5
 
     @classmethod
     def get_ratios(
@@ -33,18 +38,17 @@ class AggregationAlgorithm:
         data_dict: dict[int, ParameterMessage],
         weight_dict: dict[int, float],
     ) -> TensorDict:
+        # Only the result is allocated, the weighted parameters are added in place
         assert data_dict
         avg_data: TensorDict = {}
         for worker_id, v in data_dict.items():
             ratio = weight_dict[worker_id]
             assert 0 <= ratio <= 1
-
-            d = {k2: v2 * ratio for (k2, v2) in v.parameter.items()}
             if not avg_data:
-                avg_data = d
-            else:
-                for k in avg_data:
-                    avg_data[k] += d[k]
+                avg_data = {k: torch.mul(p, ratio) for k, p in v.parameter.items()}
+                continue
+            for k, p in avg_data.items():
+                p.add_(v.parameter[k], alpha=ratio)
         for p in avg_data.values():
             assert not p.isnan().any().cpu()
         return avg_data
@@ -60,16 +64,34 @@ class AggregationAlgorithm:
                 worker_data.delta_parameter = tensor_to(
                     worker_data.delta_parameter, device="cpu"
                 )
+                if self._can_aggregate_delta(worker_data, old_parameter_dict):
+                    return worker_data
                 return worker_data.restore(old_parameter_dict)
             case ParameterMessage():
                 if old_parameter_dict is not None:
                     worker_data.complete(old_parameter_dict)
                 worker_data.parameter = tensor_to(worker_data.parameter, device="cpu")
                 return worker_data
+            case MaskedParameterMessage():
+                worker_data.values = tensor_to(worker_data.values, device="cpu")
+                worker_data.masks = tensor_to(worker_data.masks, device="cpu")
+                return worker_data
             case Message():
                 return worker_data
         raise NotImplementedError(worker_data)
 
+    @property
+    def allow_pre_aggregation(self) -> bool:
+        # Whether the updates of co-located workers can be combined before upload
+        return False
+
+    def _can_aggregate_delta(
+        self, worker_data: DeltaParameterMessage, old_parameter_dict: TensorDict
+    ) -> bool:
+        # Algorithms that are linear in the parameters can aggregate the deltas
+        # without restoring the full models
+        return False
+
     def process_worker_data(
         self,
         worker_id: int,
@@ -85,12 +107,23 @@ class AggregationAlgorithm:
             old_parameter_dict=old_parameter_dict,
         )
 
+    def set_staleness(self, worker_id: int, staleness: int) -> None:
+        assert staleness >= 0
+        self._staleness[worker_id] = staleness
+
+    def _get_staleness_factor(self, worker_id: int) -> float:
+        staleness = self._staleness.get(worker_id, 0)
+        if staleness == 0:
+            return 1
+        return (1 + staleness) ** -self.staleness_exponent
+
     def aggregate_worker_data(self) -> Any:
         raise NotImplementedError()
 
     def clear_worker_data(self) -> None:
         self._all_worker_data.clear()
         self._skipped_workers.clear()
+        self._staleness.clear()
 
     def exit(self) -> None:
         pass
@@ -1,20 +1,27 @@
-from typing import Any
-
-import torch
 from cyy_naive_lib.log import get_logger
 from cyy_torch_toolbox.typing import TensorDict
 
-from ..message import Message, ParameterMessage
+from ..message import (DeltaParameterMessage, MaskedParameterMessage, Message,
+                       ParameterMessage)
 from .aggregation_algorithm import AggregationAlgorithm
+from .parameter_accumulator import ParameterAccumulator
 
 
 class FedAVGAlgorithm(AggregationAlgorithm):
     def __init__(self) -> None:
         super().__init__()
         self.accumulate: bool = True
-        self.__dtypes: dict[str, Any] = {}
-        self.__total_weights: dict[str, float] = {}
-        self.__parameter: TensorDict = {}
+        self.__accumulator: ParameterAccumulator = ParameterAccumulator()
+        # The global model the deltas are added to and their total weight
+        self.__delta_base: TensorDict | None = None
+        self.__delta_weight: float = 0
+        # Stale updates only move the global model part of the way, the global
+        # model keeps the weight they lost
+        self.__stale_base: TensorDict | None = None
+        self.__stale_weight: float = 0
+
+    def set_aggregation_thread_number(self, thread_number: int) -> None:
+        self.__accumulator.set_thread_number(thread_number)
 
     def process_worker_data(
         self,
@@ -34,46 +41,98 @@ class FedAVGAlgorithm(AggregationAlgorithm):
         worker_data = self._all_worker_data.get(worker_id, None)
         if worker_data is None:
             return
-        if not isinstance(worker_data, ParameterMessage):
-            return
-        for k, v in worker_data.parameter.items():
-            self.__dtypes[k] = v.dtype
-            weight = self._get_weight(
-                dataset_size=worker_data.dataset_size, name=k, parameter=v
-            )
-            tmp = v.to(dtype=torch.float64) * weight
-            if k not in self.__parameter:
-                self.__parameter[k] = tmp
-            else:
-                self.__parameter[k] += tmp
-            if k not in self.__total_weights:
-                self.__total_weights[k] = weight
-            else:
-                self.__total_weights[k] += weight
-        # release to reduce memory pressure
-        worker_data.parameter = {}
+        match worker_data:
+            case ParameterMessage():
+                parameter = worker_data.parameter
+            case DeltaParameterMessage():
+                parameter = worker_data.delta_parameter
+            case MaskedParameterMessage():
+                # Only the kept elements are averaged, so no mask is rebuilt from
+                # the values
+                masks = {k: worker_data.get_mask(k) for k in worker_data.masks}
+                staleness_factor = self._get_staleness_factor(worker_id)
+                self.__accumulator.add_masked(
+                    values=worker_data.values,
+                    masks=masks,
+                    shapes=worker_data.shapes,
+                    weight=worker_data.dataset_size * staleness_factor,
+                )
+                if staleness_factor != 1:
+                    assert old_parameter_dict is not None
+                    self.__accumulator.add_masked(
+                        values={
+                            k: old_parameter_dict[k].reshape(-1)[
+                                mask.reshape(-1).to(device=old_parameter_dict[k].device)
+                            ]
+                            for k, mask in masks.items()
+                        },
+                        masks=masks,
+                        shapes=worker_data.shapes,
+                        weight=worker_data.dataset_size * (1 - staleness_factor),
+                    )
+                worker_data.values = {}
+                worker_data.masks = {}
+                return
+            case _:
+                return
+        weight = self._get_weight(
+            dataset_size=worker_data.dataset_size, parameter=parameter
+        )
+        staleness_factor = self._get_staleness_factor(worker_id)
+        if staleness_factor != 1:
+            # The result is global * (1 - a) + sum(w_i * model_i), where w_i is the
+            # discounted data share of update i and a is the sum of the w_i
+            assert not isinstance(weight, dict)
+            assert old_parameter_dict is not None
+            self.__stale_base = old_parameter_dict
+            self.__stale_weight += weight * (1 - staleness_factor)
+            weight *= staleness_factor
+        self.__accumulator.add(parameter, weight)
+        if isinstance(worker_data, DeltaParameterMessage):
+            assert not isinstance(weight, dict)
+            assert old_parameter_dict is not None
+            self.__delta_base = old_parameter_dict
+            self.__delta_weight += weight
+            # release to reduce memory pressure
+            worker_data.delta_parameter = {}
+        else:
+            worker_data.parameter = {}
 
-    def _get_weight(self, dataset_size: int, name: str, parameter: Any) -> Any:
+    @property
+    def allow_pre_aggregation(self) -> bool:
+        return self.accumulate
+
+    def _can_aggregate_delta(
+        self, worker_data: DeltaParameterMessage, old_parameter_dict: TensorDict
+    ) -> bool:
+        # sum(w * (old + delta)) / W = (sum(w * delta) + W_delta * old) / W
+        return (
+            self.accumulate
+            and worker_data.delta_parameter.keys() == old_parameter_dict.keys()
+        )
+
+    def _get_weight(
+        self, dataset_size: int, parameter: TensorDict
+    ) -> float | TensorDict:
+        # Either one weight for the whole model or element-wise weights
         assert dataset_size != 0
         return dataset_size
 
-    def _apply_total_weight(
-        self, name: str, parameter: torch.Tensor, total_weight: Any
-    ) -> torch.Tensor:
-        return parameter / total_weight
-
     def aggregate_worker_data(self) -> Message:
         if not self.accumulate:
             return self._aggregate_worker_data(self._all_worker_data)
-        assert self.__parameter
-        parameter = self.__parameter
-        self.__parameter = {}
-        for k, v in parameter.items():
-            parameter[k] = self._apply_total_weight(
-                name=k, parameter=v, total_weight=self.__total_weights[k]
-            ).to(dtype=self.__dtypes[k])
-            assert not parameter[k].isnan().any().cpu()
-        self.__total_weights = {}
+        assert not self.__accumulator.empty
+        if self.__delta_base is not None:
+            self.__accumulator.add(
+                self.__delta_base, self.__delta_weight, count_weight=False
+            )
+            self.__delta_base = None
+            self.__delta_weight = 0
+        if self.__stale_base is not None:
+            self.__accumulator.add(self.__stale_base, self.__stale_weight)
+            self.__stale_base = None
+            self.__stale_weight = 0
+        parameter = self.__accumulator.pop()
         return ParameterMessage(
             parameter=parameter,
             end_training=next(iter(self._all_worker_data.values())).end_training,
@@ -41,6 +41,11 @@ class GraphNodeEmbeddingPassingAlgorithm(FedAVGAlgorithm):
                 self.__node_embeddings.append(node_embedding)
             self.__boundaris[worker_id] = worker_data.other_data.pop("boundary")
 
+    @property
+    def allow_pre_aggregation(self) -> bool:
+        # The node embeddings and boundaries are per worker
+        return False
+
     def __get_node_embedding(self, node_idx):
         list_idx, tensor_idx = self.__node_embedding_indices[node_idx]
         return self.__node_embeddings[list_idx][tensor_idx]
@@ -0,0 +1,199 @@
+import concurrent.futures
+from typing import Any, Callable
+
+import torch
+from cyy_torch_toolbox.typing import TensorDict
+
+# Shards smaller than this are not worth a thread
+_min_shard_size: int = 1 << 16
+
+
+class ParameterAccumulator:
+    # Sum weighted parameter dicts into one flat float64 buffer, the buffer is kept
+    # and reused by the following rounds as long as the parameter layout is the same
+    def __init__(self, thread_number: int = 1) -> None:
+        self.__index: dict[str, tuple[int, torch.Size, torch.dtype]] = {}
+        self.__buffer: torch.Tensor | None = None
+        self.__weight_buffer: torch.Tensor | None = None
+        self.__total_weight: float = 0
+        self.__elementwise: bool = False
+        self.__count: int = 0
+        self.__thread_number: int = thread_number
+        self.__executor: concurrent.futures.ThreadPoolExecutor | None = None
+        # Each shard is an element range of the buffer and the parts of the
+        # parameters in it
+        self.__shards: list[tuple[int, int, list]] = []
+
+    @property
+    def empty(self) -> bool:
+        return self.__count == 0
+
+    def set_thread_number(self, thread_number: int) -> None:
+        assert thread_number >= 1
+        self.__thread_number = thread_number
+        if self.__buffer is not None:
+            self.__build_shards()
+
+    def __build_shards(self) -> None:
+        assert self.__buffer is not None
+        total_size = self.__buffer.numel()
+        shard_number = min(self.__thread_number, max(total_size // _min_shard_size, 1))
+        bounds = [total_size * i // shard_number for i in range(shard_number + 1)]
+        self.__shards = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            parts: list = []
+            for k, (offset, shape, _) in self.__index.items():
+                low = max(start, offset)
+                high = min(end, offset + shape.numel())
+                if low < high:
+                    parts.append((k, low - offset, high - offset, low))
+            self.__shards.append((start, end, parts))
+        if shard_number > 1 and self.__executor is None:
+            self.__executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.__thread_number
+            )
+
+    def __run(self, fun: Callable, *args: Any) -> list:
+        # Every element is always summed in the order of the additions, so the
+        # result does not depend on the sharding
+        if len(self.__shards) == 1:
+            return [fun(self.__shards[0], *args)]
+        assert self.__executor is not None
+        return list(self.__executor.map(lambda shard: fun(shard, *args), self.__shards))
+
+    def __prepare(self, parameter: TensorDict, elementwise: bool) -> None:
+        if self.__count == 0:
+            if self.__index.keys() != parameter.keys() or any(
+                self.__index[k][1] != v.shape for k, v in parameter.items()
+            ):
+                self.__index = {}
+                offset = 0
+                for k, v in parameter.items():
+                    self.__index[k] = (offset, v.shape, v.dtype)
+                    offset += v.numel()
+                self.__buffer = torch.zeros(offset, dtype=torch.float64)
+                self.__weight_buffer = None
+                self.__build_shards()
+            else:
+                assert self.__buffer is not None
+                self.__buffer.zero_()
+                for k, v in parameter.items():
+                    offset, shape, _ = self.__index[k]
+                    self.__index[k] = (offset, shape, v.dtype)
+            self.__total_weight = 0
+            self.__elementwise = elementwise
+            if elementwise:
+                if self.__weight_buffer is None:
+                    self.__weight_buffer = torch.zeros_like(self.__buffer)
+                else:
+                    self.__weight_buffer.zero_()
+        assert parameter.keys() == self.__index.keys()
+        assert elementwise == self.__elementwise
+
+    def __add_shard(
+        self,
+        shard: tuple,
+        parameter: TensorDict,
+        weight: float | TensorDict,
+        count_weight: bool,
+    ) -> None:
+        assert self.__buffer is not None
+        _, _, parts = shard
+        views = [
+            self.__buffer[buffer_low : buffer_low + high - low]
+            for _, low, high, buffer_low in parts
+        ]
+        tensors = [parameter[k].reshape(-1)[low:high] for k, low, high, _ in parts]
+        if isinstance(weight, dict):
+            assert self.__weight_buffer is not None
+            weights = [weight[k].reshape(-1)[low:high] for k, low, high, _ in parts]
+            torch._foreach_addcmul_(views, tensors, weights)
+            if count_weight:
+                torch._foreach_add_(
+                    [
+                        self.__weight_buffer[buffer_low : buffer_low + high - low]
+                        for _, low, high, buffer_low in parts
+                    ],
+                    weights,
+                )
+        else:
+            torch._foreach_add_(views, tensors, alpha=weight)
+
+    def add(
+        self,
+        parameter: TensorDict,
+        weight: float | TensorDict,
+        count_weight: bool = True,
+    ) -> None:
+        # The weight of a parameter that is already counted by other additions is
+        # not counted again
+        elementwise = isinstance(weight, dict)
+        self.__prepare(parameter, elementwise=elementwise)
+        self.__run(self.__add_shard, parameter, weight, count_weight)
+        if not elementwise and count_weight:
+            self.__total_weight += weight
+        self.__count += 1
+
+    def add_masked(
+        self,
+        values: TensorDict,
+        masks: TensorDict,
+        shapes: dict[str, torch.Size],
+        weight: float,
+    ) -> None:
+        # Add the elements selected by the masks, the other elements get no weight
+        self.__prepare(
+            {
+                k: torch.empty(shape, dtype=values[k].dtype, device="meta")
+                for k, shape in shapes.items()
+            },
+            elementwise=True,
+        )
+        assert self.__buffer is not None and self.__weight_buffer is not None
+        for k, (offset, shape, _) in self.__index.items():
+            indices = masks[k].reshape(-1).nonzero().squeeze(1) + offset
+            self.__buffer.index_add_(
+                0, indices, values[k].to(dtype=torch.float64), alpha=weight
+            )
+            self.__weight_buffer.index_put_(
+                (indices,),
+                torch.tensor(weight, dtype=torch.float64),
+                accumulate=True,
+            )
+        self.__count += 1
+
+    def __finalize_shard(self, shard: tuple) -> bool:
+        assert self.__buffer is not None
+        start, end, _ = shard
+        buffer = self.__buffer[start:end]
+        if not self.__elementwise:
+            buffer.div_(self.__total_weight)
+        else:
+            assert self.__weight_buffer is not None
+            weight_buffer = self.__weight_buffer[start:end]
+            # Elements that no worker updated keep the weight 1 to avoid dividing
+            # by zero
+            weight_buffer[weight_buffer == 0] = 1
+            buffer.div_(weight_buffer)
+        return bool(buffer.isnan().any().cpu())
+
+    def __get_parameter(self, item: tuple) -> torch.Tensor:
+        assert self.__buffer is not None
+        _, (offset, shape, dtype) = item
+        return (
+            self.__buffer[offset : offset + shape.numel()]
+            .view(shape)
+            .to(dtype=dtype, copy=True)
+        )
+
+    def pop(self) -> TensorDict:
+        assert self.__buffer is not None and self.__count > 0
+        assert not any(self.__run(self.__finalize_shard))
+        self.__count = 0
+        items = list(self.__index.items())
+        if len(self.__shards) == 1:
+            tensors = [self.__get_parameter(item) for item in items]
+        else:
+            assert self.__executor is not None
+            tensors = list(self.__executor.map(self.__get_parameter, items))
+        return {k: tensor for (k, _), tensor in zip(items, tensors)}
@@ -1,17 +1,101 @@
 import functools
-import itertools
+import heapq
+import json
+import os
 
-from cyy_naive_lib.topology.central_topology import ProcessPipeCentralTopology
+from cyy_naive_lib.log import get_logger
 from cyy_torch_toolbox.data_structure.torch_process_context import \
     TorchProcessContext
 
 from .config import DistributedTrainingConfig
+from .practitioner import Practitioner
 from .method.algorithm_factory import CentralizedAlgorithmFactory
+from .topology.central_topology import PipeCentralTopology
+from .topology.shared_memory_topology import SharedMemoryCentralTopology
+
+
+def get_measured_epoch_seconds(session_dir: str) -> dict[int, float]:
+    epoch_seconds: dict[int, float] = {}
+    for root, _, files in os.walk(session_dir):
+        if "epoch_time.json" not in files:
+            continue
+        with open(os.path.join(root, "epoch_time.json"), "rt", encoding="utf8") as f:
+            record = json.load(f)
+        if record["epoch_seconds"]:
+            epoch_seconds[record["practitioner_id"]] = sum(
+                record["epoch_seconds"]
+            ) / len(record["epoch_seconds"])
+    return epoch_seconds
+
+
+def get_practitioner_costs(
+    config: DistributedTrainingConfig, practitioners: list[Practitioner]
+) -> dict[int, float]:
+    dataset_sizes: dict[int, int] = {
+        practitioner.worker_id: practitioner.get_training_set_size(
+            config.dc_config.dataset_name
+        )
+        for practitioner in practitioners
+    }
+    epoch_seconds: dict[int, float] = {}
+    if config.worker_cost_dir:
+        epoch_seconds = get_measured_epoch_seconds(config.worker_cost_dir)
+    measured: dict[int, float] = {
+        practitioner.worker_id: epoch_seconds[practitioner.id]
+        for practitioner in practitioners
+        if practitioner.id in epoch_seconds
+    }
+    if not measured:
+        return {k: float(v) for k, v in dataset_sizes.items()}
+    # Estimate the epoch time of unmeasured practitioners by their dataset sizes
+    seconds_per_sample = sum(measured.values()) / max(
+        sum(dataset_sizes[worker_id] for worker_id in measured), 1
+    )
+    return {
+        worker_id: measured.get(worker_id, dataset_size * seconds_per_sample)
+        for worker_id, dataset_size in dataset_sizes.items()
+    }
+
+
+def pack_practitioners(
+    config: DistributedTrainingConfig, practitioners: list[Practitioner]
+) -> dict[int, list[Practitioner]]:
+    costs = get_practitioner_costs(config, practitioners)
+    # Longest-processing-time-first: assign the most expensive remaining worker to
+    # the least loaded process
+    loads: list[tuple[float, int]] = [
+        (0, process_idx) for process_idx in range(config.parallel_number)
+    ]
+    assignment: dict[int, list[Practitioner]] = {}
+    for practitioner in sorted(
+        practitioners, key=lambda p: (-costs[p.worker_id], p.worker_id)
+    ):
+        load, process_idx = heapq.heappop(loads)
+        assignment.setdefault(process_idx, []).append(practitioner)
+        heapq.heappush(loads, (load + costs[practitioner.worker_id], process_idx))
+    process_loads = [load for load, process_idx in loads if process_idx in assignment]
+    mean_load = sum(process_loads) / len(process_loads)
+    for process_idx in sorted(assignment.keys()):
+        get_logger().info(
+            "process %s runs workers %s",
+            process_idx,
+            sorted(practitioner.worker_id for practitioner in assignment[process_idx]),
+        )
+    get_logger().info(
+        "predicted process imbalance (max load/mean load) is %s",
+        max(process_loads) / mean_load if mean_load > 0 else 1,
+    )
+    return assignment
 
 
 def get_worker_config(
     config: DistributedTrainingConfig, practitioners: None | set = None
 ) -> dict:
+    assert CentralizedAlgorithmFactory.has_algorithm(config.distributed_algorithm)
+    # Only the selected method and the domain libraries of the configuration are
+    # imported, the worker processes do the same on demand.
+    CentralizedAlgorithmFactory.import_algorithm(config.distributed_algorithm)
+    config.import_domain_libraries()
     if practitioners is None:
         practitioners = config.create_practitioners()
     else:
@@ -22,8 +106,10 @@ def get_worker_config(
             assert practitioner.has_dataset(config.dc_config.dataset_name)
             practitioner.set_worker_id(worker_id)
     assert practitioners
-    assert CentralizedAlgorithmFactory.has_algorithm(config.distributed_algorithm)
-    topology = ProcessPipeCentralTopology(
+    topology_cls = PipeCentralTopology
+    if config.shared_memory_transport:
+        topology_cls = SharedMemoryCentralTopology
+    topology = topology_cls(
         mp_context=TorchProcessContext(), worker_num=config.worker_number
     )
     result: dict = {"topology": topology}
@@ -35,27 +121,28 @@ def get_worker_config(
         kwargs={"config": config},
     )
     client_config: dict = {}
-    for practitioner, next_process_idx in zip(
-        practitioners, itertools.cycle(list(range(config.parallel_number)))
-    ):
-        if next_process_idx not in client_config:
-            client_config[next_process_idx] = []
-        client_config[next_process_idx].append(
-            {
-                "constructor": functools.partial(
-                    CentralizedAlgorithmFactory.create_client,
-                    algorithm_name=config.distributed_algorithm,
-                    endpoint_kwargs=config.endpoint_kwargs.get("worker", {})
-                    | {
-                        "worker_id": practitioner.worker_id,
-                    },
-                    kwargs={
-                        "config": config,
-                        "practitioner": practitioner,
-                    },
-                ),
-            }
-        )
+    for next_process_idx, process_practitioners in pack_practitioners(
+        config, sorted(practitioners, key=lambda p: p.worker_id)
+    ).items():
+        client_config[next_process_idx] = []
+        for practitioner in process_practitioners:
+            client_config[next_process_idx].append(
+                {
+                    "worker_id": practitioner.worker_id,
+                    "constructor": functools.partial(
+                        CentralizedAlgorithmFactory.create_client,
+                        algorithm_name=config.distributed_algorithm,
+                        endpoint_kwargs=config.endpoint_kwargs.get("worker", {})
+                        | {
+                            "worker_id": practitioner.worker_id,
+                        },
+                        kwargs={
+                            "config": config,
+                            "practitioner": practitioner,
+                        },
+                    ),
+                }
+            )
     assert client_config
     result["worker"] = client_config
     return result
@@ -8,11 +8,21 @@ import dill
 
 class Session:
     def __init__(self, session_dir: str):
-        with open(
-            os.path.join(session_dir, "round_record.json"), "rt", encoding="utf8"
-        ) as f:
-            self.round_record = json.load(f)
-        self.round_record = {int(k): v for k, v in self.round_record.items()}
+        record_path = os.path.join(session_dir, "round_record.json")
+        if os.path.isfile(record_path):
+            with open(record_path, "rt", encoding="utf8") as f:
+                self.round_record = json.load(f)
+            self.round_record = {int(k): v for k, v in self.round_record.items()}
+        else:
+            # The session did not exit normally, use the rounds recorded so far
+            self.round_record = {}
+            with open(
+                os.path.join(session_dir, "round_record.jsonl"), "rt", encoding="utf8"
+            ) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.round_record[record.pop("round")] = record
         with open(os.path.join(session_dir, "config.pkl"), "rb") as f:
             self.config = pickle.load(f)
 
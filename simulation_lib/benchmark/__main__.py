@@ -0,0 +1,29 @@
+import argparse
+import json
+
+from .runner import method_configs, model_sizes, run_sweep
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the simulator overhead on synthetic data"
+    )
+    parser.add_argument(
+        "--methods", nargs="+", default=list(method_configs), choices=method_configs
+    )
+    parser.add_argument("--worker_numbers", nargs="+", type=int, default=[2, 8])
+    parser.add_argument("--parallel_numbers", nargs="+", type=int, default=[1, 2])
+    parser.add_argument("--model_size", default="tiny", choices=model_sizes)
+    parser.add_argument("--round_number", type=int, default=3)
+    parser.add_argument("--sample_number", type=int, default=10000)
+    parser.add_argument("--output", default="benchmark.json")
+    args = parser.parse_args()
+    results = run_sweep(
+        methods=args.methods,
+        worker_numbers=args.worker_numbers,
+        parallel_numbers=args.parallel_numbers,
+        model_size=args.model_size,
+        round_number=args.round_number,
+        sample_number=args.sample_number,
+    )
+    with open(args.output, "wt", encoding="utf8") as f:
+        json.dump(results, f, indent=2)
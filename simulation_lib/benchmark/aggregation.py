@@ -0,0 +1,193 @@
+import argparse
+import json
+import multiprocessing
+import random
+import resource
+from types import SimpleNamespace
+from typing import Any
+
+import torch
+from cyy_naive_lib.time_counter import TimeCounter
+
+from ..algorithm.fed_avg_algorithm import FedAVGAlgorithm
+from ..message import ParameterMessage
+from ..method.shapley_value.shapley_value_algorithm import \
+    ShapleyValueAlgorithm
+from .runner import model_sizes
+from .synthetic import create_mlp
+
+
+def create_worker_data(
+    worker_number: int, model_size: str, input_size: int = 64
+) -> dict[int, ParameterMessage]:
+    torch.manual_seed(0)
+    return {
+        worker_id: ParameterMessage(
+            parameter={
+                k: v.detach().clone()
+                for k, v in create_mlp(
+                    input_size=input_size, **model_sizes[model_size]
+                )
+                .state_dict()
+                .items()
+            },
+            dataset_size=100 + worker_id,
+        )
+        for worker_id in range(worker_number)
+    }
+
+
+class _Server:
+    # What ShapleyValueAlgorithm needs from the server, the metrics are not computed
+    def __init__(self) -> None:
+        self.config = SimpleNamespace(algorithm_kwargs={}, round=1, save_dir="")
+        self.round_number = 1
+
+    def get_metric(self, parameter_dict: dict, keep_performance_logger: bool) -> dict:
+        return {"accuracy": 0}
+
+
+def __measure_subset_averaging(
+    worker_number: int, model_size: str, method: str, conn: Any
+) -> None:
+    worker_data = create_worker_data(worker_number, model_size)
+    algorithm = ShapleyValueAlgorithm(sv_algorithm_cls=None, server=_Server())
+    for worker_id, data in worker_data.items():
+        algorithm.process_worker_data(
+            worker_id=worker_id,
+            worker_data=data,
+            old_parameter_dict=None,
+            save_dir="",
+        )
+    # This is what a GTG round does: evaluate the prefixes of random permutations,
+    # each subset once
+    rng = random.Random(0)
+    permutations: list[list[int]] = []
+    for _ in range(worker_number):
+        permutation = sorted(worker_data)
+        rng.shuffle(permutation)
+        permutations.append(permutation)
+    # ru_maxrss is in KiB on Linux, what exceeds this level is used by averaging
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    counter = TimeCounter()
+    subsets: set[frozenset] = set()
+    for permutation in permutations:
+        for end in range(1, worker_number + 1):
+            subset = frozenset(permutation[:end])
+            if subset in subsets:
+                continue
+            subsets.add(subset)
+            match method:
+                case "prefix_sum":
+                    algorithm._get_subset_metric(subset)
+                case "weighted_avg":
+                    FedAVGAlgorithm._aggregate_worker_data(
+                        {k: v for k, v in worker_data.items() if k in subset}
+                    )
+                case _:
+                    raise NotImplementedError(method)
+    conn.send(
+        {
+            "method": method,
+            "subset_number": len(subsets),
+            "seconds": counter.elapsed_milliseconds() / 1000,
+            "peak_extra_rss_bytes": (
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+            )
+            * 1024,
+        }
+    )
+
+
+def measure_accumulation_throughput(
+    worker_number: int, model_size: str, thread_numbers: list[int], repeat: int = 3
+) -> list[dict]:
+    worker_data = create_worker_data(worker_number, model_size)
+    parameter_bytes = sum(
+        v.element_size() * v.numel()
+        for data in worker_data.values()
+        for v in data.parameter.values()
+    )
+    results: list[dict] = []
+    reference: dict | None = None
+    for thread_number in thread_numbers:
+        algorithm = FedAVGAlgorithm()
+        algorithm.set_aggregation_thread_number(thread_number)
+        seconds = 0.0
+        for _ in range(repeat):
+            counter = TimeCounter()
+            for worker_id, data in worker_data.items():
+                algorithm.process_worker_data(
+                    worker_id=worker_id,
+                    worker_data=ParameterMessage(
+                        parameter=dict(data.parameter),
+                        dataset_size=data.dataset_size,
+                    ),
+                    old_parameter_dict=None,
+                    save_dir="",
+                )
+            parameter = algorithm.aggregate_worker_data().parameter
+            seconds += counter.elapsed_milliseconds() / 1000
+            algorithm.clear_worker_data()
+        # The sharded sums must be identical to the single-thread ones
+        if reference is None:
+            reference = parameter
+        assert all(torch.equal(reference[k], v) for k, v in parameter.items())
+        results.append(
+            {
+                "worker_number": worker_number,
+                "model_size": model_size,
+                "thread_number": thread_number,
+                "seconds": seconds / repeat,
+                "bytes_per_second": parameter_bytes * repeat / seconds,
+            }
+        )
+    return results
+
+
+def measure_subset_averaging(worker_number: int, model_size: str) -> list[dict]:
+    # A fresh process for each measurement so that the peaks are not shared
+    ctx = multiprocessing.get_context("spawn")
+    results: list[dict] = []
+    # Averaging each subset from scratch against the incremental prefix sums of
+    # ShapleyValueAlgorithm
+    for method in ("weighted_avg", "prefix_sum"):
+        parent_conn, child_conn = ctx.Pipe()
+        process = ctx.Process(
+            target=__measure_subset_averaging,
+            args=(worker_number, model_size, method, child_conn),
+        )
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+        results.append(
+            {"worker_number": worker_number, "model_size": model_size}
+            | parent_conn.recv()
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the aggregation of synthetic worker updates"
+    )
+    parser.add_argument("--worker_number", type=int, default=10)
+    parser.add_argument("--model_size", default="large", choices=model_sizes)
+    parser.add_argument("--thread_numbers", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--output", default="aggregation_benchmark.json")
+    args = parser.parse_args()
+    with open(args.output, "wt", encoding="utf8") as f:
+        json.dump(
+            {
+                "subset_averaging": measure_subset_averaging(
+                    worker_number=args.worker_number, model_size=args.model_size
+                ),
+                "accumulation": measure_accumulation_throughput(
+                    worker_number=args.worker_number,
+                    model_size=args.model_size,
+                    thread_numbers=args.thread_numbers,
+                ),
+            },
+            f,
+            indent=2,
+        )
@@ -0,0 +1,150 @@
+import copy
+import json
+import multiprocessing
+import os
+import resource
+from typing import Any
+
+from cyy_naive_lib.log import get_logger
+from cyy_naive_lib.time_counter import TimeCounter
+
+from ..config import DistributedTrainingConfig, load_config_from_dict
+from ..training import train
+from . import synthetic
+
+model_sizes: dict[str, dict] = {
+    "tiny": {"hidden_size": 32, "hidden_layer_number": 1},
+    "large": {"hidden_size": 2048, "hidden_layer_number": 4},
+}
+
+# The settings each method needs besides the common ones
+method_configs: dict[str, dict] = {
+    "fed_avg": {},
+    "fed_paq": {},
+    "fed_obd": {
+        "endpoint_kwargs": {"server": {"weight": 0.01}, "worker": {"weight": 0.01}},
+        "algorithm_kwargs": {"second_phase_epoch": 1, "dropout_rate": 0.9},
+    },
+    "multiround_shapley_value": {},
+    "GTG_shapley_value": {},
+}
+
+
+def get_benchmark_config(
+    method: str,
+    worker_number: int,
+    parallel_number: int,
+    model_size: str = "tiny",
+    round_number: int = 3,
+    sample_number: int = 10000,
+    input_size: int = 64,
+    class_number: int = 10,
+) -> DistributedTrainingConfig:
+    conf: dict = {
+        "exp_name": "benchmark",
+        "dataset_name": synthetic.dataset_name,
+        "dataset_kwargs": {
+            "sample_number": sample_number,
+            "input_size": input_size,
+            "class_number": class_number,
+        },
+        "model_name": synthetic.model_name,
+        "model_kwargs": {"input_size": input_size} | model_sizes[model_size],
+        "domain_libraries": [synthetic.__name__],
+        "distributed_algorithm": method,
+        "worker_number": worker_number,
+        "parallel_number": parallel_number,
+        "round": round_number,
+        "epoch": 1,
+        "batch_size": 64,
+        "optimizer_name": "SGD",
+        "learning_rate": 0.01,
+        "learning_rate_scheduler_name": "CosineAnnealingLR",
+    } | copy.deepcopy(method_configs[method])
+    return copy.deepcopy(load_config_from_dict(conf))
+
+
+def __train_in_process(config: DistributedTrainingConfig, conn: Any) -> None:
+    counter = TimeCounter()
+    train(config=config)
+    seconds = counter.elapsed_milliseconds() / 1000
+    # ru_maxrss is in KiB on Linux, the peak of the children is the largest one
+    # among the pool processes
+    conn.send(
+        {
+            "seconds": seconds,
+            "peak_rss_bytes": max(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            )
+            * 1024,
+        }
+    )
+
+
+def run_benchmark(config: DistributedTrainingConfig) -> dict:
+    # Each run gets a fresh process so that the peak RSS is not inherited from the
+    # previous runs
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe()
+    process = ctx.Process(target=__train_in_process, args=(config, child_conn))
+    process.start()
+    process.join()
+    if process.exitcode != 0 or not parent_conn.poll():
+        raise RuntimeError(f"benchmark failed with exit code {process.exitcode}")
+    result: dict = parent_conn.recv()
+
+    with open(
+        os.path.join(config.get_save_dir(), "server", "round_timing.json"),
+        "rt",
+        encoding="utf8",
+    ) as f:
+        round_timing: dict = {int(k): v for k, v in json.load(f).items()}
+    result["rounds_per_second"] = len(round_timing) / result["seconds"]
+    result["mean_round"] = {
+        key: sum(timing[key] for timing in round_timing.values()) / len(round_timing)
+        for key in (
+            "wait_seconds",
+            "work_seconds",
+            "aggregate_seconds",
+            "evaluate_seconds",
+        )
+    }
+    for key in ("sent_bytes", "received_bytes"):
+        result[key] = sum(timing[key] for timing in round_timing.values())
+    result["rounds"] = round_timing
+    result["save_dir"] = config.get_save_dir()
+    return result
+
+
+def run_sweep(
+    methods: list[str],
+    worker_numbers: list[int],
+    parallel_numbers: list[int],
+    **kwargs: Any,
+) -> list[dict]:
+    results: list[dict] = []
+    for method in methods:
+        for worker_number in worker_numbers:
+            for parallel_number in parallel_numbers:
+                config = get_benchmark_config(
+                    method=method,
+                    worker_number=worker_number,
+                    parallel_number=parallel_number,
+                    **kwargs,
+                )
+                result = {
+                    "method": method,
+                    "worker_number": worker_number,
+                    "parallel_number": parallel_number,
+                } | kwargs
+                result |= run_benchmark(config)
+                get_logger().warning(
+                    "%s with %s workers and %s processes: %.3f rounds per second",
+                    method,
+                    worker_number,
+                    parallel_number,
+                    result["rounds_per_second"],
+                )
+                results.append(result)
+    return results
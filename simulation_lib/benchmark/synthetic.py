@@ -0,0 +1,83 @@
+# In-memory classification datasets and MLPs used by the benchmark. Importing this
+# module registers them, so it is listed in domain_libraries and every process of
+# a benchmark imports it before creating a dataset collection.
+from typing import Any
+
+import torch
+from cyy_torch_toolbox import DatasetType
+from cyy_torch_toolbox.dataset.repository import register_dataset_factory
+from cyy_torch_toolbox.factory import Factory
+from cyy_torch_toolbox.model import global_model_factory
+from torch import nn
+
+dataset_name: str = "synthetic_classification"
+model_name: str = "synthetic_mlp"
+
+
+class SyntheticClassificationDataset(torch.utils.data.Dataset):
+    def __init__(
+        self,
+        sample_number: int,
+        input_size: int,
+        class_number: int,
+        seed: int,
+    ) -> None:
+        generator = torch.Generator().manual_seed(seed)
+        # The labels come from a fixed random linear teacher so that the task can
+        # be learned and the same teacher is shared by all splits
+        teacher = torch.randn(
+            input_size, class_number, generator=torch.Generator().manual_seed(0)
+        )
+        self.data = torch.randn(sample_number, input_size, generator=generator)
+        self.targets = (self.data @ teacher).argmax(dim=1)
+
+    def __getitem__(self, index: int) -> tuple:
+        return self.data[index], self.targets[index]
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+
+def create_synthetic_dataset(
+    train: bool = True,
+    split: str | None = None,
+    sample_number: int = 10000,
+    input_size: int = 64,
+    class_number: int = 10,
+    **kwargs: Any,
+) -> SyntheticClassificationDataset:
+    if split is not None:
+        train = split == "train"
+    if not train:
+        sample_number = max(sample_number // 5, 1)
+    return SyntheticClassificationDataset(
+        sample_number=sample_number,
+        input_size=input_size,
+        class_number=class_number,
+        seed=1 if train else 2,
+    )
+
+
+def create_mlp(
+    input_size: int = 64,
+    num_classes: int = 10,
+    hidden_size: int = 32,
+    hidden_layer_number: int = 1,
+    **kwargs: Any,
+) -> nn.Module:
+    layers: list = []
+    in_features = input_size
+    for _ in range(hidden_layer_number):
+        layers += [nn.Linear(in_features, hidden_size), nn.ReLU()]
+        in_features = hidden_size
+    layers.append(nn.Linear(in_features, num_classes))
+    return nn.Sequential(*layers)
+
+
+dataset_factory = Factory()
+dataset_factory.register(dataset_name, create_synthetic_dataset)
+register_dataset_factory(DatasetType.Vision, dataset_factory)
+
+if DatasetType.Vision not in global_model_factory:
+    global_model_factory[DatasetType.Vision] = Factory()
+global_model_factory[DatasetType.Vision].register(model_name, create_mlp)
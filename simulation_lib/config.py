@@ -1,16 +1,32 @@
+import copy
 import datetime
+import importlib
 import os
+import pickle
+import sys
 import uuid
 from typing import Any
 
 import hydra
 import omegaconf
+from cyy_naive_lib.log import get_logger
+from cyy_naive_lib.time_counter import TimeCounter
 from cyy_torch_toolbox import Config
-from cyy_torch_toolbox.dataset import ClassificationDatasetCollection
+from cyy_torch_toolbox.dataset import (ClassificationDatasetCollection,
+                                       DatasetCollection)
 from cyy_torch_toolbox.device import get_devices
 
 from .practitioner import Practitioner
 from .sampler import get_dataset_collection_sampler
+from .util.dataset_store import SharedDatasetStore
+
+# Dataset collections created in this process, processes of the warm pool reuse
+# them across tasks. The least recently used ones are dropped beyond the limit.
+_dataset_collection_cache: dict = {}
+_max_cached_dataset_collections: int = 2
+
+# The domain libraries registering datasets and models, cyy_torch_graph is optional
+_domain_libraries: tuple = ("cyy_torch_vision", "cyy_torch_text", "cyy_torch_graph")
 
 
 class DistributedTrainingConfig(Config):
@@ -20,6 +36,9 @@ class DistributedTrainingConfig(Config):
         self.distributed_algorithm: str = ""
         self.worker_number: int = 0
         self.parallel_number: int = len(get_devices())
+        # Session directory of an earlier run whose measured epoch times are used
+        # to balance workers among processes
+        self.worker_cost_dir: str = ""
         self.round: int = 0
         self.dataset_sampling: str = "iid"
         self.dataset_sampling_kwargs: dict[str, Any] = {}
@@ -27,9 +46,46 @@ class DistributedTrainingConfig(Config):
         self.merge_validation_to_training_set = False
         self.log_file: str = ""
         self.limited_resource: bool = False
+        # Share one memory-mapped copy of the dataset collection among the processes
+        # of this host
+        self.share_dataset_collection: bool = False
+        # Move tensors between the server and the workers through shared memory
+        # instead of the pipes
+        self.shared_memory_transport: bool = False
+        # Bytes of device memory (or CPU memory) shared by concurrent trainers,
+        # None means the memory available when the training starts
+        self.memory_budget: int | None = None
+        # The domain libraries providing the dataset and the model, None means
+        # all of them
+        self.domain_libraries: list[str] | None = None
         self.endpoint_kwargs: dict = {}
         self.algorithm_kwargs: dict = {}
 
+    def import_domain_libraries(self) -> None:
+        libraries = [
+            library
+            for library in (
+                _domain_libraries
+                if self.domain_libraries is None
+                else self.domain_libraries
+            )
+            if library not in sys.modules
+        ]
+        if not libraries:
+            return
+        counter = TimeCounter()
+        for library in libraries:
+            try:
+                importlib.import_module(library)
+            except ImportError:
+                if self.domain_libraries is not None or library != "cyy_torch_graph":
+                    raise
+        get_logger().info(
+            "import %s in %.3f seconds",
+            libraries,
+            counter.elapsed_milliseconds() / 1000,
+        )
+
     def load_config_and_process(self, conf: Any) -> None:
         self.load_config(conf)
         task_time = datetime.datetime.now()
@@ -52,6 +108,26 @@ class DistributedTrainingConfig(Config):
         self.log_file = str(os.path.join("log", dir_suffix)) + ".log"
         assert self.reproducible_env_config.make_reproducible_env
 
+    def create_dataset_collection(self) -> DatasetCollection:
+        self.import_domain_libraries()
+        if self.share_dataset_collection:
+            # Every call gets its own collection object while the array payloads
+            # are mapped from the same files
+            return SharedDatasetStore(key=self.dc_config).get(
+                super().create_dataset_collection
+            )
+        # The same key as the shared store
+        key = pickle.dumps(self.dc_config, protocol=4)
+        dataset_collection = _dataset_collection_cache.pop(key, None)
+        if dataset_collection is None:
+            dataset_collection = super().create_dataset_collection()
+            while len(_dataset_collection_cache) >= _max_cached_dataset_collections:
+                _dataset_collection_cache.pop(next(iter(_dataset_collection_cache)))
+        # Dicts keep the insertion order, the last one is the most recently used
+        _dataset_collection_cache[key] = dataset_collection
+        # Each executor transforms and samples its own copy
+        return copy.deepcopy(dataset_collection)
+
     def create_practitioners(self) -> set:
         practitioners = set()
         dataset_collection = self.create_dataset_collection()
@@ -102,3 +178,8 @@ def load_config_from_file(
     conf = omegaconf.OmegaConf.load(config_file)
     __load_config(conf)
     return global_config
+
+
+def load_config_from_dict(conf: dict) -> DistributedTrainingConfig:
+    __load_config(omegaconf.OmegaConf.create(conf))
+    return global_config
@@ -0,0 +1,47 @@
+from typing import Any
+
+import psutil
+import torch
+from cyy_naive_lib.log import get_logger
+
+
+class DeviceMemoryScheduler:
+    # Admit executors as long as their measured peak memory fits in the budget
+    def __init__(self, manager: Any, budget: int | None = None) -> None:
+        if budget is None:
+            budget = self.get_default_budget()
+        get_logger().info("use memory budget %s bytes", budget)
+        self.__budget: int = budget
+        self.__condition = manager.Condition()
+        self.__reservations = manager.dict()
+        self.__max_peak_bytes = manager.Value("q", 0)
+
+    @classmethod
+    def get_default_budget(cls) -> int:
+        if torch.cuda.is_available():
+            return sum(
+                torch.cuda.mem_get_info(device=device_idx)[0]
+                for device_idx in range(torch.cuda.device_count())
+            )
+        return psutil.virtual_memory().available
+
+    def acquire(self, name: str, needed_bytes: int | None) -> None:
+        with self.__condition:
+            if needed_bytes is None:
+                # Before an executor is measured we assume it is as large as the
+                # largest one seen, or runs exclusively if there is nothing measured.
+                needed_bytes = self.__max_peak_bytes.value
+                if needed_bytes == 0:
+                    needed_bytes = self.__budget
+            while self.__reservations and (
+                sum(self.__reservations.values()) + needed_bytes > self.__budget
+            ):
+                self.__condition.wait()
+            self.__reservations[name] = needed_bytes
+
+    def release(self, name: str, peak_bytes: int | None = None) -> None:
+        with self.__condition:
+            self.__reservations.pop(name, None)
+            if peak_bytes is not None and peak_bytes > self.__max_peak_bytes.value:
+                self.__max_peak_bytes.value = peak_bytes
+            self.__condition.notify_all()
@@ -3,14 +3,16 @@ import multiprocessing
 import os
 import threading
 from functools import cached_property
-from typing import Any, Callable
+from typing import Any
 
 import gevent.local
 import gevent.lock
+import psutil
 import torch
 from cyy_torch_toolbox.device import get_device
 
 from .config import DistributedTrainingConfig
+from .device_scheduler import DeviceMemoryScheduler
 
 
 class ExecutorContext:
@@ -39,19 +41,21 @@ class ExecutorContext:
 
 
 class Executor:
-    __thread_data = threading.local()
-
     def __init__(
         self,
         config: DistributedTrainingConfig,
         name: str,
-        device_lock: threading.RLock,
+        device_scheduler: DeviceMemoryScheduler,
     ) -> None:
         self.__config: DistributedTrainingConfig = copy.deepcopy(config)
-        self.__used_device_memory = None
+        self.__used_device_memory: int | None = None
         self.__name = name
-        self.__device_lock: threading.RLock = device_lock
+        self.__device_scheduler: DeviceMemoryScheduler = device_scheduler
         self.__hold_device_lock: bool = False
+        self.__rss_before_lock: int = 0
+        # The device chosen while holding the device lock, executors running as
+        # greenlets of one thread must not share it
+        self.__device: torch.device | None = None
 
     @property
     def config(self) -> DistributedTrainingConfig:
@@ -66,31 +70,52 @@ class Executor:
         os.makedirs(executor_save_dir, exist_ok=True)
         return executor_save_dir
 
-    def _get_device(self, lock_callback: None | Callable = None) -> torch.device:
-        if not hasattr(self.__thread_data, "device"):
-            if not self.__hold_device_lock:
-                self.__device_lock.acquire()
-                self.__hold_device_lock = True
-                if lock_callback is not None:
-                    lock_callback()
-            self.__thread_data.device = get_device(
-                max_needed_bytes=self.__used_device_memory
+    def _get_device(self) -> torch.device:
+        # The reservation is held until _release_device_lock
+        if not self.__hold_device_lock:
+            self.__device_scheduler.acquire(
+                name=self.__name, needed_bytes=self.__used_device_memory
             )
-            if "cuda" in self.__thread_data.device.type.lower():
-                torch.cuda.set_device(self.__thread_data.device)
-        return self.__thread_data.device
+            self.__hold_device_lock = True
+            self.__rss_before_lock = psutil.Process().memory_info().rss
+            self.__device = get_device(max_needed_bytes=self.__used_device_memory)
+            if "cuda" in self.__device.type.lower():
+                torch.cuda.reset_peak_memory_stats(device=self.__device)
+        assert self.__device is not None
+        if "cuda" in self.__device.type.lower():
+            torch.cuda.set_device(self.__device)
+        return self.__device
+
+    def _get_min_reserved_bytes(self) -> int:
+        return 0
 
     def _get_execution_context(self) -> ExecutorContext:
         return ExecutorContext(name=self.__name)
 
     def _release_device_lock(self, **kwargs: Any) -> None:
         if self.__hold_device_lock:
-            if "cuda" in self.__thread_data.device.type.lower():
-                stats = torch.cuda.memory_stats(device=self.__thread_data.device)
+            assert self.__device is not None
+            if "cuda" in self.__device.type.lower():
+                stats = torch.cuda.memory_stats(device=self.__device)
                 if stats:
                     self.__used_device_memory = stats["allocated_bytes.all.peak"]
-            self.__device_lock.release()
+            else:
+                # Approximate: the RSS growth of the process while the lock was
+                # held, other executors of the process running in between add to
+                # it and freed memory kept by the allocator is not subtracted
+                self.__used_device_memory = max(
+                    psutil.Process().memory_info().rss - self.__rss_before_lock, 0
+                )
+            # A measurement of 0 would let every executor through
+            self.__used_device_memory = max(
+                self.__used_device_memory or 0, self._get_min_reserved_bytes()
+            )
+            self.__device_scheduler.release(
+                name=self.__name, peak_bytes=self.__used_device_memory
+            )
             self.__hold_device_lock = False
+            # The next acquisition asks the scheduler and chooses a device again
+            self.__device = None
 
     def start(self) -> None:
         raise NotImplementedError()
@@ -49,7 +49,38 @@ class DeltaParameterMessage(ParameterMessageBase):
         return msg
 
 
-def get_message_size(msg: Message) -> int:
+_bit_weights: torch.Tensor = torch.tensor(
+    [128, 64, 32, 16, 8, 4, 2, 1], dtype=torch.uint8
+)
+
+
+def pack_mask(mask: torch.Tensor) -> torch.Tensor:
+    bits = mask.reshape(-1).to(dtype=torch.uint8)
+    bits = torch.nn.functional.pad(bits, (0, -bits.numel() % 8))
+    return (bits.view(-1, 8) * _bit_weights.to(device=bits.device)).sum(
+        dim=1, dtype=torch.uint8
+    )
+
+
+def unpack_mask(packed_mask: torch.Tensor, shape: torch.Size) -> torch.Tensor:
+    bits = packed_mask.unsqueeze(-1).bitwise_and(
+        _bit_weights.to(device=packed_mask.device)
+    )
+    return bits.reshape(-1)[: shape.numel()].view(shape) != 0
+
+
+@dataclass(kw_only=True)
+class MaskedParameterMessage(ParameterMessageBase):
+    # The kept elements of each parameter and the bit-packed masks selecting them
+    values: TensorDict
+    masks: TensorDict
+    shapes: dict[str, torch.Size]
+
+    def get_mask(self, name: str) -> torch.Tensor:
+        return unpack_mask(self.masks[name], self.shapes[name])
+
+
+def get_tensor_size(data: Any) -> int:
     cnt: int = 0
 
     def count(data: torch.Tensor, **kwargs: Any) -> torch.Tensor:
@@ -57,6 +88,11 @@ def get_message_size(msg: Message) -> int:
         cnt += data.element_size() * data.numel()
         return data
 
-    recursive_tensor_op(msg, fun=count)
+    recursive_tensor_op(data, fun=count)
+    return cnt
+
+
+def get_message_size(msg: Message) -> int:
+    cnt: int = get_tensor_size(msg)
     assert cnt > 0
     return cnt
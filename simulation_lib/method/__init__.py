@@ -1,9 +1,18 @@
-from .common_import import *  # noqa: F401
+from .algorithm_factory import CentralizedAlgorithmFactory
 
-from .fed_avg import *  # noqa: F401
-from .fed_dropout_avg import *  # noqa: F401
-from .fed_gcn import *  # noqa: F401
-from .fed_gnn import *  # noqa: F401
-from .fed_obd import *  # noqa: F401
-from .fed_paq import *  # noqa: F401
-from .shapley_value import *  # noqa: F401
+# The method packages are only imported when their algorithms are used
+for algorithm_name, package_name in (
+    ("fed_avg", "fed_avg"),
+    ("fed_dropout_avg", "fed_dropout_avg"),
+    ("fed_gcn", "fed_gcn"),
+    ("fed_gnn", "fed_gnn"),
+    ("fed_obd", "fed_obd"),
+    ("fed_obd_sq", "fed_obd"),
+    ("fed_paq", "fed_paq"),
+    ("multiround_shapley_value", "shapley_value"),
+    ("GTG_shapley_value", "shapley_value"),
+    ("Hierarchical_shapley_value", "shapley_value"),
+):
+    CentralizedAlgorithmFactory.register_lazy_algorithm(
+        algorithm_name=algorithm_name, module_name=f"{__name__}.{package_name}"
+    )
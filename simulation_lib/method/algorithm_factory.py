@@ -1,10 +1,36 @@
+import importlib
 from typing import Callable
 
-from cyy_naive_lib.topology.cs_endpoint import ClientEndpoint, ServerEndpoint
+from cyy_naive_lib.log import get_logger
+from cyy_naive_lib.time_counter import TimeCounter
+
+from ..topology.endpoint import ClientEndpoint, ServerEndpoint
 
 
 class CentralizedAlgorithmFactory:
     config: dict[str, dict] = {}
+    # Algorithm name -> the module registering it, imported on first use
+    lazy_config: dict[str, str] = {}
+
+    @classmethod
+    def register_lazy_algorithm(cls, algorithm_name: str, module_name: str) -> None:
+        assert algorithm_name not in cls.lazy_config
+        cls.lazy_config[algorithm_name] = module_name
+
+    @classmethod
+    def import_algorithm(cls, algorithm_name: str) -> None:
+        if algorithm_name in cls.config:
+            return
+        module_name = cls.lazy_config[algorithm_name]
+        counter = TimeCounter()
+        importlib.import_module(module_name)
+        get_logger().info(
+            "import %s for %s in %.3f seconds",
+            module_name,
+            algorithm_name,
+            counter.elapsed_milliseconds() / 1000,
+        )
+        assert algorithm_name in cls.config
 
     @classmethod
     def register_algorithm(
@@ -32,7 +58,7 @@ class CentralizedAlgorithmFactory:
 
     @classmethod
     def has_algorithm(cls, algorithm_name: str) -> bool:
-        return algorithm_name in cls.config
+        return algorithm_name in cls.config or algorithm_name in cls.lazy_config
 
     @classmethod
     def create_client(
@@ -43,6 +69,7 @@ class CentralizedAlgorithmFactory:
         extra_kwargs: dict | None = None,
         extra_endpoint_kwargs: dict | None = None,
     ) -> None:
+        cls.import_algorithm(algorithm_name)
         config = cls.config[algorithm_name]
         if extra_kwargs is None:
             extra_kwargs = {}
@@ -62,6 +89,7 @@ class CentralizedAlgorithmFactory:
         extra_kwargs: dict | None = None,
         extra_endpoint_kwargs: dict | None = None,
     ) -> None:
+        cls.import_algorithm(algorithm_name)
         config = cls.config[algorithm_name]
         if extra_kwargs is None:
             extra_kwargs = {}
@@ -1,16 +1,6 @@
-import cyy_torch_text  # noqa: F401
-import cyy_torch_vision  # noqa: F401
-
 from ..algorithm.fed_avg_algorithm import *  # noqa: F401
 from ..message import *  # noqa: F401
 from ..server.aggregation_server import *  # noqa: F401
-from ..server.graph_server import *  # noqa: F401
 from ..topology.quantized_endpoint import *  # noqa: F401
 from ..worker.aggregation_worker import *  # noqa: F401
 from ..worker.error_feedback_worker import *  # noqa: F401
-from ..worker.graph_worker import *  # noqa: F401
-
-try:
-    import cyy_torch_graph  # noqa: F401
-except BaseException:
-    pass
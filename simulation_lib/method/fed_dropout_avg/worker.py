@@ -3,8 +3,10 @@ from typing import Any
 
 import torch
 from cyy_naive_lib.log import get_logger
+from cyy_torch_toolbox.tensor import tensor_to
 
-from ..common_import import AggregationWorker, ParameterMessage
+from ..common_import import (AggregationWorker, MaskedParameterMessage,
+                             ParameterMessage, pack_mask)
 
 
 class FedDropoutAvgWorker(AggregationWorker):
@@ -13,18 +15,27 @@ class FedDropoutAvgWorker(AggregationWorker):
         self.__dropout_rate: float = self.config.algorithm_kwargs["dropout_rate"]
         get_logger().error("use dropout_rate %s", self.__dropout_rate)
 
-    def _get_sent_data(self) -> ParameterMessage:
+    def _get_sent_data(self) -> MaskedParameterMessage:
         self._send_parameter_diff = False
         sent_data = super()._get_sent_data()
         assert isinstance(sent_data, ParameterMessage)
-        parameter = sent_data.parameter
-        total_num: float = 0
-        send_num: float = 0
+        parameter = tensor_to(sent_data.parameter, device="cpu")
+        values: dict = {}
+        masks: dict = {}
         for k, v in parameter.items():
-            weight = torch.bernoulli(torch.full_like(v, 1 - self.__dropout_rate))
-            parameter[k] = v * weight
-            total_num += parameter[k].numel()
-            send_num += torch.count_nonzero(parameter[k]).item()
+            mask = torch.rand(v.shape) >= self.__dropout_rate
+            # Only the kept elements and one bit per element are sent
+            values[k] = v[mask]
+            masks[k] = pack_mask(mask)
+        total_num = sum(v.numel() for v in parameter.values())
+        send_num = sum(v.numel() for v in values.values())
         get_logger().error("send_num %s", send_num)
         get_logger().error("total_num %s", total_num)
-        return sent_data
+        return MaskedParameterMessage(
+            dataset_size=sent_data.dataset_size,
+            other_data=sent_data.other_data,
+            end_training=sent_data.end_training,
+            values=values,
+            masks=masks,
+            shapes={k: v.shape for k, v in parameter.items()},
+        )
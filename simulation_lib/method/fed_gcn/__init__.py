@@ -1,8 +1,8 @@
 """
 FedGCN: Convergence and Communication Tradeoffs in Federated Training of Graph Convolutional Networks
 """
+from ...server.graph_server import GraphNodeServer
 from ..algorithm_factory import CentralizedAlgorithmFactory
-from ..common_import import GraphNodeServer
 from .worker import FedGCNWorker
 
 CentralizedAlgorithmFactory.register_algorithm(
@@ -1,4 +1,4 @@
-from ..common_import import GraphWorker
+from ...worker.graph_worker import GraphWorker
 
 
 class FedGCNWorker(GraphWorker):
@@ -1,5 +1,6 @@
+from ...server.graph_server import GraphNodeServer
+from ...worker.graph_worker import GraphWorker
 from ..algorithm_factory import CentralizedAlgorithmFactory
-from ..common_import import GraphNodeServer, GraphWorker
 
 CentralizedAlgorithmFactory.register_algorithm(
     algorithm_name="fed_gnn",
@@ -10,6 +10,11 @@ from .phase import Phase
 class FedOBDServer(AggregationServer):
     def __init__(self, **kwargs: Any) -> None:
         super().__init__(algorithm=FedAVGAlgorithm(), **kwargs)
+        # The workers upload different blocks
+        assert not self.config.algorithm_kwargs.get("pre_aggregation", False)
+        # The phase switch and the stat keys need the metric of every round as soon
+        # as it is aggregated, so evaluating in the background gains nothing
+        assert not self.config.algorithm_kwargs.get("async_evaluation", False)
         self.__phase: Phase = Phase.STAGE_ONE
         assert isinstance(self._endpoint, QuantServerEndpoint)
         self._endpoint.quant_broadcast = True
@@ -20,9 +25,12 @@ class FedOBDServer(AggregationServer):
         return super()._select_workers()
 
     def _get_stat_key(self):
-        if not self.performance_stat:
-            return super()._get_stat_key()
-        return max(self.performance_stat.keys()) + 1
+        # Phase two evaluates several times in one round, these evaluations take
+        # the keys after the round number
+        key = super()._get_stat_key()
+        if self.performance_stat:
+            key = max(key, max(self.performance_stat.keys()) + 1)
+        return key
 
     def _aggregate_worker_data(self) -> ParameterMessageBase:
         result: ParameterMessageBase = super()._aggregate_worker_data()
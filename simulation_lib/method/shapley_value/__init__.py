@@ -1,6 +1,7 @@
 from ..algorithm_factory import CentralizedAlgorithmFactory
 from ..common_import import AggregationWorker
 from .GTG_shapley_value_server import GTGShapleyValueServer
+from .hierarchical_shapley_value_server import HierarchicalShapleyValueServer
 from .multiround_shapley_value_server import MultiRoundShapleyValueServer
 
 CentralizedAlgorithmFactory.register_algorithm(
@@ -13,3 +14,8 @@ CentralizedAlgorithmFactory.register_algorithm(
     client_cls=AggregationWorker,
     server_cls=GTGShapleyValueServer,
 )
+CentralizedAlgorithmFactory.register_algorithm(
+    algorithm_name="Hierarchical_shapley_value",
+    client_cls=AggregationWorker,
+    server_cls=HierarchicalShapleyValueServer,
+)
@@ -0,0 +1,116 @@
+import json
+import math
+import os
+
+from cyy_naive_lib.log import get_logger
+from cyy_torch_algorithm.shapely_value.gtg_shapley_value import GTGShapleyValue
+
+from .shapley_value_algorithm import ShapleyValueAlgorithm
+
+
+class HierarchicalShapleyValueAlgorithm(ShapleyValueAlgorithm):
+    # Value groups of workers first and then the workers within each group, the
+    # values in a group are scaled to add up to the value of the group
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(GTGShapleyValue, *args, **kwargs)
+        self.__groups: list[list[int]] = []
+        self.__group_sv_algorithms: list = []
+        self.evaluation_stat: dict = {}
+
+    def __create_groups(self) -> None:
+        players = list(self._get_players())
+        group_number = self.config.algorithm_kwargs.get(
+            "part_number", round(math.sqrt(len(players)))
+        )
+        group_number = min(max(group_number, 1), len(players))
+        # Neighbouring worker ids form a group
+        bounds = [len(players) * i // group_number for i in range(group_number + 1)]
+        self.__groups = [
+            players[start:end] for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+        get_logger().warning("value workers in groups %s", self.__groups)
+        init_metric = self._get_init_metric()
+        self.sv_algorithm = self.sv_algorithm_cls(
+            players=list(range(group_number)), last_round_metric=init_metric
+        )
+        self.__group_sv_algorithms = [
+            self.sv_algorithm_cls(players=group, last_round_metric=init_metric)
+            for group in self.__groups
+        ]
+
+    def __get_group_subset_metric(self, group_subset) -> float:
+        return self._get_subset_metric(
+            {worker_id for i in group_subset for worker_id in self.__groups[i]}
+        )
+
+    def _compute_shapley_values(self) -> None:
+        if self.sv_algorithm is None:
+            self.__create_groups()
+        assert self.sv_algorithm is not None
+        round_number = self._server.round_number
+        self.sv_algorithm.set_metric_function(self.__get_group_subset_metric)
+        self.sv_algorithm.compute(round_number=round_number)
+        group_values = self.sv_algorithm.shapley_values
+        group_values_S = self.sv_algorithm.shapley_values_S
+        # GTG needs about as many permutations as players with one evaluation per
+        # player in each, so its cost is c * players^2. c is estimated from the
+        # group level run.
+        group_number = len(self.__groups)
+        cost_constant = self._requested_subset_number / group_number**2
+        shapley_values: dict = {}
+        shapley_values_S: dict = {}
+        for i, (group, sv_algorithm) in enumerate(
+            zip(self.__groups, self.__group_sv_algorithms)
+        ):
+            sv_algorithm.set_metric_function(self._get_subset_metric)
+            sv_algorithm.compute(round_number=round_number)
+            values = sv_algorithm.shapley_values
+            total_value = sum(values.values())
+            for worker_id in group:
+                if total_value != 0:
+                    shapley_values[worker_id] = (
+                        values.get(worker_id, 0) * group_values.get(i, 0) / total_value
+                    )
+                else:
+                    shapley_values[worker_id] = group_values.get(i, 0) / len(group)
+            if i in group_values_S:
+                shapley_values_S |= {
+                    worker_id: shapley_values[worker_id]
+                    for worker_id in sv_algorithm.shapley_values_S
+                }
+        self.shapley_values[round_number] = shapley_values
+        self.shapley_values_S[round_number] = shapley_values_S
+        flat_evaluation_number = round(
+            cost_constant * len(list(self._get_players())) ** 2
+        )
+        hierarchical_evaluation_number = round(
+            cost_constant
+            * (group_number**2 + sum(len(group) ** 2 for group in self.__groups))
+        )
+        self.evaluation_stat[round_number] = {
+            "evaluation_number": self._requested_subset_number,
+            "speculative_evaluation_number": self._speculative_subset_number,
+            "estimated_evaluation_number": hierarchical_evaluation_number,
+            "estimated_flat_evaluation_number": flat_evaluation_number,
+            "estimated_saved_evaluation_number": max(
+                flat_evaluation_number - hierarchical_evaluation_number, 0
+            ),
+        }
+        get_logger().info(
+            "round %s requests %s subset evaluations and %s speculative ones, "
+            "about %s by estimate while flat GTG needs about %s",
+            round_number,
+            self._requested_subset_number,
+            self._speculative_subset_number,
+            hierarchical_evaluation_number,
+            flat_evaluation_number,
+        )
+
+    def exit(self) -> None:
+        super().exit()
+        with open(
+            os.path.join(self.config.save_dir, "shapley_value_evaluations.json"),
+            "wt",
+            encoding="utf8",
+        ) as f:
+            json.dump(self.evaluation_stat, f)
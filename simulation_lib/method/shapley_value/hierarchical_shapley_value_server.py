@@ -0,0 +1,10 @@
+from .hierarchical_shapley_value_algorithm import \
+    HierarchicalShapleyValueAlgorithm
+from .shapley_value_server import ShapleyValueServer
+
+
+class HierarchicalShapleyValueServer(ShapleyValueServer):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(
+            **kwargs, algorithm=HierarchicalShapleyValueAlgorithm(server=self)
+        )
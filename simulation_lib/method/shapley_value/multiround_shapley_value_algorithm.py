@@ -1,3 +1,5 @@
+import itertools
+
 from cyy_torch_algorithm.shapely_value.multiround_shapley_value import \
     MultiRoundShapleyValue
 
@@ -7,3 +9,19 @@ from .shapley_value_algorithm import ShapleyValueAlgorithm
 class MultiRoundShapleyValueAlgorithm(ShapleyValueAlgorithm):
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(MultiRoundShapleyValue, *args, **kwargs)
+
+    def _get_batch_subsets(self, subset: frozenset) -> list[frozenset]:
+        # Every subset is evaluated in each round, so batch the following ones in
+        # the order of their sizes
+        subsets = [subset]
+        players = list(self._get_players())
+        for size in range(len(subset), len(players) + 1):
+            for combination in itertools.combinations(players, size):
+                if len(subsets) >= self.sv_batch_size:
+                    return subsets
+                other_subset = frozenset(combination)
+                if other_subset != subset and not self._has_subset_metric(
+                    other_subset
+                ):
+                    subsets.append(other_subset)
+        return subsets
@@ -3,8 +3,11 @@ import json
 import os
 from typing import Any, Iterable, Type
 
+import torch
 from cyy_naive_lib.log import get_logger
+from cyy_torch_toolbox.typing import TensorDict
 
+from ...util.evaluator_pool import EvaluatorPool
 from ..common_import import AggregationServer, FedAVGAlgorithm, Message
 
 
@@ -20,6 +23,19 @@ class ShapleyValueAlgorithm(FedAVGAlgorithm):
         self.sv_algorithm_cls = sv_algorithm_cls
         self.shapley_values: dict = {}
         self.shapley_values_S: dict = {}
+        # The subset models are only evaluated, so they share one buffer
+        self.__subset_parameter: dict = {}
+        # The metrics of the subsets evaluated in this round
+        self.__subset_metrics: dict[frozenset, float] = {}
+        # The subsets asked for by the sampler, the other evaluated subsets were
+        # speculatively added to a batch
+        self.__requested_subsets: set[frozenset] = set()
+        # The weighted parameter sum of the last subset, the next subset of a
+        # permutation only adds one worker to it
+        self.__prefix: frozenset = frozenset()
+        self.__prefix_sum: TensorDict = {}
+        self.__prefix_weight: float = 0
+        self.__evaluator_pool: EvaluatorPool | None = None
 
     @property
     def config(self):
@@ -29,17 +45,70 @@ class ShapleyValueAlgorithm(FedAVGAlgorithm):
     def choose_best_subset(self) -> bool:
         return self.config.algorithm_kwargs.get("choose_best_subset", False)
 
+    @property
+    def sv_batch_size(self) -> int | None:
+        batch_size = self.config.algorithm_kwargs.get("sv_batch_size", None)
+        if batch_size is None:
+            batch_size = self.sv_evaluator_number
+        if batch_size is None and self.sv_accuracy_tolerance is not None:
+            batch_size = 1
+        return batch_size
+
+    @property
+    def sv_evaluator_number(self) -> int | None:
+        return self.config.algorithm_kwargs.get("sv_evaluator_number", None)
+
+    @property
+    def sv_accuracy_tolerance(self) -> float | None:
+        # Evaluate subsets on growing parts of the test set until the accuracies are
+        # known within this tolerance, the last round always uses the whole set
+        if self._server.round_number >= self.config.round:
+            return None
+        return self.config.algorithm_kwargs.get("sv_accuracy_tolerance", None)
+
     def _get_players(self) -> Iterable:
         return sorted(self._all_worker_data.keys())
 
+    def _get_init_metric(self) -> float:
+        assert self._server.round_number == 1
+        return self._server.performance_stat[self._server.round_number - 1][
+            f"test_{self.metric_type}"
+        ]
+
+    @property
+    def _evaluated_subset_number(self) -> int:
+        return len(self.__subset_metrics)
+
+    @property
+    def _requested_subset_number(self) -> int:
+        return len(self.__requested_subsets)
+
+    @property
+    def _speculative_subset_number(self) -> int:
+        return len(self.__subset_metrics.keys() - self.__requested_subsets)
+
     def aggregate_worker_data(self) -> Message:
+        self.__subset_metrics.clear()
+        self.__requested_subsets.clear()
+        # The workers have new parameters in this round
+        self.__reset_prefix()
+        self._compute_shapley_values()
+        if self.choose_best_subset:
+            best_subset: set = set(
+                self.shapley_values_S[self._server.round_number].keys()
+            )
+            if best_subset:
+                get_logger().warning("use subset %s", best_subset)
+                self._all_worker_data = {
+                    k: v for k, v in self._all_worker_data.items() if k in best_subset
+                }
+        return super().aggregate_worker_data()
+
+    def _compute_shapley_values(self) -> None:
         if self.sv_algorithm is None:
-            assert self._server.round_number == 1
             self.sv_algorithm = self.sv_algorithm_cls(
                 players=self._get_players(),
-                last_round_metric=self._server.performance_stat[
-                    self._server.round_number - 1
-                ][f"test_{self.metric_type}"],
+                last_round_metric=self._get_init_metric(),
             )
         assert self.sv_algorithm is not None
         self.sv_algorithm.set_metric_function(self._get_subset_metric)
@@ -50,33 +119,137 @@ class ShapleyValueAlgorithm(FedAVGAlgorithm):
         self.shapley_values_S[self._server.round_number] = self._convert_shapley_values(
             self.sv_algorithm.shapley_values_S
         )
-        if self.choose_best_subset:
-            best_subset: set = set(
-                self.shapley_values_S[self._server.round_number].keys()
-            )
-            if best_subset:
-                get_logger().warning("use subset %s", best_subset)
-                self._all_worker_data = {
-                    k: v for k, v in self._all_worker_data.items() if k in best_subset
-                }
-        return super().aggregate_worker_data()
 
     def _convert_shapley_values(self, shapley_values: dict) -> dict:
         return shapley_values
 
+    def _get_batch_subsets(self, subset: frozenset) -> list[frozenset]:
+        # The next prefix of a permutation adds one of the remaining players
+        subsets = [subset]
+        for player in self._get_players():
+            if len(subsets) >= self.sv_batch_size:
+                break
+            extended_subset = subset | {player}
+            if extended_subset != subset and not self._has_subset_metric(
+                extended_subset
+            ):
+                subsets.append(extended_subset)
+        return subsets
+
+    def _has_subset_metric(self, subset: frozenset) -> bool:
+        return subset in self.__subset_metrics
+
+    def __reset_prefix(self) -> None:
+        for v in self.__prefix_sum.values():
+            v.zero_()
+        self.__prefix = frozenset()
+        self.__prefix_weight = 0
+
+    def __move_prefix(self, subset: frozenset) -> None:
+        if not (self.__prefix <= subset and len(subset - self.__prefix) <= 1):
+            self.__reset_prefix()
+        for worker_id in sorted(subset - self.__prefix):
+            worker_data = self._all_worker_data[worker_id]
+            if self.__prefix_sum.keys() != worker_data.parameter.keys():
+                # The dtype of the parameters, like the plain weighted average,
+                # mixed dtypes take a slow path
+                self.__prefix_sum = {
+                    k: torch.zeros_like(
+                        v, dtype=torch.promote_types(v.dtype, torch.float32)
+                    )
+                    for k, v in worker_data.parameter.items()
+                }
+            for k, v in self.__prefix_sum.items():
+                v.add_(worker_data.parameter[k], alpha=worker_data.dataset_size)
+            self.__prefix_weight += worker_data.dataset_size
+        self.__prefix = subset
+
+    def __get_subset_parameter(
+        self, subset: frozenset, out: TensorDict | None = None
+    ) -> TensorDict:
+        self.__move_prefix(subset)
+        if out is None or out.keys() != self.__prefix_sum.keys():
+            out = {k: torch.empty_like(v) for k, v in self.__prefix_sum.items()}
+        for k, v in self.__prefix_sum.items():
+            torch.div(v, self.__prefix_weight, out=out[k])
+        return out
+
+    def __get_extended_subset_parameter(
+        self, subset: frozenset, worker_id: int
+    ) -> TensorDict:
+        # The prefix is kept so that its other extensions cost one addition too
+        assert subset == self.__prefix
+        worker_data = self._all_worker_data[worker_id]
+        weight = self.__prefix_weight + worker_data.dataset_size
+        return {
+            k: torch.add(v, worker_data.parameter[k], alpha=worker_data.dataset_size)
+            .div_(weight)
+            for k, v in self.__prefix_sum.items()
+        }
+
+    def __get_batched_subset_metric(self, subset: frozenset) -> float:
+        subsets = self._get_batch_subsets(subset)
+        assert subsets[0] == subset
+        parameters = [self.__get_subset_parameter(subset)]
+        for other_subset in subsets[1:]:
+            if (
+                self.__prefix == subset
+                and other_subset > subset
+                and len(other_subset - subset) == 1
+            ):
+                (worker_id,) = other_subset - subset
+                parameters.append(
+                    self.__get_extended_subset_parameter(subset, worker_id)
+                )
+            else:
+                parameters.append(self.__get_subset_parameter(other_subset))
+        if self.sv_evaluator_number is not None:
+            if self.__evaluator_pool is None:
+                self.__evaluator_pool = EvaluatorPool(
+                    config=self.config, process_number=self.sv_evaluator_number
+                )
+            metrics = self.__evaluator_pool.get_metrics(
+                parameters, metric_type=self.metric_type
+            )
+        elif self.sv_accuracy_tolerance is not None:
+            metrics = self._server.get_adaptive_accuracies(
+                parameters,
+                tolerance=self.sv_accuracy_tolerance,
+                chunk_number=self.config.algorithm_kwargs.get(
+                    "sv_test_chunk_number", 10
+                ),
+            )
+        else:
+            metrics = self._server.get_batched_accuracies(parameters)
+        self.__subset_metrics.update(zip(subsets, metrics))
+        return self.__subset_metrics[subset]
+
     def _get_subset_metric(self, subset) -> dict:
         assert subset
-        worker_data = FedAVGAlgorithm._aggregate_worker_data(
-            {k: v for k, v in self._all_worker_data.items() if k in subset}
+        subset = frozenset(subset)
+        self.__requested_subsets.add(subset)
+        if subset in self.__subset_metrics:
+            return self.__subset_metrics[subset]
+        if self.sv_batch_size is not None:
+            # The batched evaluator in the server only computes accuracy
+            assert (
+                self.sv_evaluator_number is not None
+                or self.metric_type == "accuracy"
+            )
+            return self.__get_batched_subset_metric(subset)
+        self.__subset_parameter = self.__get_subset_parameter(
+            subset, out=self.__subset_parameter
         )
-
-        assert worker_data
-        return self._server.get_metric(worker_data, keep_performance_logger=False)[
-            self.metric_type
-        ]
+        metric = self._server.get_metric(
+            self.__subset_parameter, keep_performance_logger=False
+        )[self.metric_type]
+        self.__subset_metrics[subset] = metric
+        return metric
 
     def exit(self) -> None:
         assert self.sv_algorithm is not None
+        if self.__evaluator_pool is not None:
+            self.__evaluator_pool.shutdown()
         with open(
             os.path.join(self.config.save_dir, "shapley_values.json"),
             "wt",
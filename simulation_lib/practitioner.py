@@ -1,4 +1,4 @@
-from cyy_torch_toolbox import Config, Trainer
+from cyy_torch_toolbox import Config, MachineLearningPhase, Trainer
 from cyy_torch_toolbox.dataset import DatasetCollectionSampler
 
 
@@ -26,6 +26,12 @@ class Practitioner:
     def has_dataset(self, name: str) -> bool:
         return name in self._dataset_sampler
 
+    def get_training_set_size(self, name: str) -> int:
+        sampler = self._dataset_sampler[name]
+        return len(
+            sampler._dataset_indices[MachineLearningPhase.Training][self.__worker_id]
+        )
+
     def create_trainer(self, config: Config) -> Trainer:
         dc = config.create_dataset_collection()
         trainer = config.create_trainer(dc=dc)
@@ -1,14 +1,22 @@
+import concurrent.futures
 import json
+import math
 import os
 import pickle
+from collections import deque
 from typing import Any
 
 from cyy_naive_lib.log import get_logger
+from cyy_naive_lib.time_counter import TimeCounter
+from cyy_torch_toolbox.tensor import tensor_to
 from cyy_torch_toolbox.typing import TensorDict
 
 from ..algorithm.aggregation_algorithm import AggregationAlgorithm
+from ..algorithm.fed_avg_algorithm import FedAVGAlgorithm
 from ..message import Message, ParameterMessage, ParameterMessageBase
+from ..util.checkpoint_writer import CheckpointWriter
 from ..util.model_cache import ModelCache
+from ..util.pending_models import PendingModels
 from .server import Server
 
 
@@ -20,6 +28,9 @@ class AggregationServer(Server):
         self.__worker_flag: set = set()
         self.__algorithm: AggregationAlgorithm = algorithm
         self.__stat: dict = {}
+        self.__round_timing: dict = {}
+        self.__aggregate_seconds: float = 0
+        self.__evaluate_seconds: float = 0
         self._compute_stat: bool = True
         self.__plateau = 0
         self.__max_acc = 0
@@ -27,6 +38,111 @@ class AggregationServer(Server):
         self.__early_stop = self.config.algorithm_kwargs.get("early_stop", False)
         if self.__early_stop:
             get_logger().warning("stop early")
+        self.__counter: TimeCounter = TimeCounter()
+        # Evaluate the global models in the background while the workers train on
+        # them, the results are applied in the order of the rounds
+        self.__evaluation_executor: concurrent.futures.ThreadPoolExecutor | None = (
+            None
+        )
+        if self.config.algorithm_kwargs.get("async_evaluation", False):
+            get_logger().warning("evaluate global models asynchronously")
+            self.__evaluation_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="server_evaluation"
+            )
+        self.__pending_evaluations: deque = deque()
+        # Evaluate every k rounds, on a sampled test subset unless it is a full
+        # evaluation round. The final round is always evaluated in full and early
+        # stopping only uses full evaluations
+        self.__evaluation_interval: int = self.config.algorithm_kwargs.get(
+            "evaluation_interval", 1
+        )
+        self.__evaluation_sample_ratio: float | None = (
+            self.config.algorithm_kwargs.get("evaluation_sample_ratio", None)
+        )
+        self.__full_evaluation_interval: int | None = (
+            self.config.algorithm_kwargs.get("full_evaluation_interval", None)
+        )
+        if self.__evaluation_sample_ratio is not None and self.__early_stop:
+            assert self.__full_evaluation_interval is not None
+        self.__full_evaluate_seconds: float = 0
+        self.__saved_evaluate_seconds: float = 0
+        self.__last_stat_key: int | None = None
+        self.__applying_evaluations: bool = False
+        self.__convergent: bool = False
+        # Models and round records are written in the background, only the rounds
+        # chosen by the retention policy stay on disk. The workers cache their
+        # models in config.save_dir/aggregated_model, so the server uses its own
+        # directory.
+        self.__checkpoint_writer: CheckpointWriter = CheckpointWriter(
+            model_dir=os.path.join(self.save_dir, "aggregated_model"),
+            save_dir=self.save_dir,
+            keep_last=self.config.algorithm_kwargs.get("checkpoint_keep_last", None),
+            keep_every=self.config.algorithm_kwargs.get("checkpoint_keep_every", None),
+            keep_best=self.config.algorithm_kwargs.get("checkpoint_keep_best", True),
+        )
+        if isinstance(algorithm, FedAVGAlgorithm):
+            algorithm.set_aggregation_thread_number(
+                self.config.algorithm_kwargs.get("aggregation_thread_number", 1)
+            )
+        # Buffered asynchronous aggregation (FedBuff): aggregate whenever this
+        # number of updates arrives and let workers continue with the newest model
+        self.__async_buffer_size: int | None = self.config.algorithm_kwargs.get(
+            "async_buffer_size", None
+        )
+        self.__buffered_update_num: int = 0
+        self.__worker_model_round: dict[int, int] = {}
+        self.__worker_update_num: dict[int, int] = {}
+        self.__stopped_workers: set[int] = set()
+        self.__async_end_training: bool = False
+        if self.__async_buffer_size is not None:
+            get_logger().warning(
+                "use asynchronous aggregation with buffer size %s",
+                self.__async_buffer_size,
+            )
+            assert isinstance(algorithm, FedAVGAlgorithm) and algorithm.accumulate
+        # Semi-synchronous aggregation: close a round at a deadline or once a quorum
+        # of the selected workers has reported
+        self.__round_deadline: float | None = self.config.algorithm_kwargs.get(
+            "round_deadline", None
+        )
+        self.__quorum: float | None = self.config.algorithm_kwargs.get(
+            "quorum", None
+        )
+        self.__late_update_policy: str = self.config.algorithm_kwargs.get(
+            "late_update_policy", "discard"
+        )
+        assert self.__late_update_policy in ("discard", "carry")
+        self.__round_counter: TimeCounter = TimeCounter()
+        # The models of the closed rounds that the workers have not started yet
+        self.__pending_models: PendingModels = PendingModels(
+            worker_ids=range(self.worker_number), first_round=1
+        )
+        self.__on_time_workers: set[int] = set()
+        self.__on_time_update_num: int = 0
+        self.__missed_workers: dict[int, list] = {}
+        if self.__semi_sync:
+            get_logger().warning(
+                "use semi-synchronous aggregation with deadline %s and quorum %s",
+                self.__round_deadline,
+                self.__quorum,
+            )
+            assert self.__async_buffer_size is None
+        # Workers in the same process may upload one combined update
+        self.__pre_aggregation: bool = self.config.algorithm_kwargs.get(
+            "pre_aggregation", False
+        )
+        if self.__pre_aggregation:
+            assert algorithm.allow_pre_aggregation
+            assert self.__async_buffer_size is None and not self.__semi_sync
+        if self.__async_buffer_size is not None or self.__semi_sync:
+            assert isinstance(algorithm, FedAVGAlgorithm) and algorithm.accumulate
+            algorithm.staleness_exponent = self.config.algorithm_kwargs.get(
+                "staleness_exponent", algorithm.staleness_exponent
+            )
+
+    @property
+    def __semi_sync(self) -> bool:
+        return self.__round_deadline is not None or self.__quorum is not None
 
     @property
     def early_stop(self) -> bool:
@@ -55,6 +171,7 @@ class AggregationServer(Server):
         return parameter_dict
 
     def _before_start(self) -> None:
+        self.__round_counter.reset_start_time()
         if self.config.distribute_init_parameters:
             self._send_result(
                 ParameterMessage(
@@ -66,17 +183,54 @@ class AggregationServer(Server):
 
     def _server_exit(self) -> None:
         self.__algorithm.exit()
+        self.__apply_evaluations(wait=True)
+        if self.__evaluation_executor is not None:
+            self.__evaluation_executor.shutdown(wait=True)
+        self.__checkpoint_writer.set_evaluated_round(self.round_number)
+        self.__checkpoint_writer.close()
+        with open(
+            os.path.join(self.save_dir, "round_record.json"),
+            "wt",
+            encoding="utf8",
+        ) as f:
+            json.dump(self.__stat, f)
+        with open(
+            os.path.join(self.save_dir, "round_timing.json"),
+            "wt",
+            encoding="utf8",
+        ) as f:
+            json.dump(self.__round_timing, f)
+        if self.__semi_sync:
+            with open(
+                os.path.join(self.save_dir, "missed_workers.json"),
+                "wt",
+                encoding="utf8",
+            ) as f:
+                json.dump(self.__missed_workers, f)
 
     def _process_worker_data(self, worker_id: int, data: Message) -> None:
         assert 0 <= worker_id < self.worker_number
         get_logger().debug("get data %s from worker %s", data, worker_id)
+        worker_ids: list[int] = [worker_id]
+        if data is not None and "pre_aggregated_worker_ids" in data.other_data:
+            assert self.__pre_aggregation
+            worker_ids = data.other_data.pop("pre_aggregated_worker_ids")
+            if type(data) is Message:
+                # All of these workers skipped this round
+                data = None
+        if self.__async_buffer_size is not None:
+            self.__process_async_worker_data(worker_id=worker_id, data=data)
+            return
+        if self.__semi_sync:
+            self.__process_semi_sync_worker_data(worker_id=worker_id, data=data)
+            return
         self.__algorithm.process_worker_data(
             worker_id=worker_id,
             worker_data=data,
             save_dir=self.config.get_save_dir(),
             old_parameter_dict=self._model_cache.parameter_dict,
         )
-        self.__worker_flag.add(worker_id)
+        self.__worker_flag.update(worker_ids)
         if len(self.__worker_flag) == self.worker_number:
             result = self._aggregate_worker_data()
             self._send_result(result)
@@ -88,30 +242,188 @@ class AggregationServer(Server):
                 self.worker_number,
             )
 
+    def __process_semi_sync_worker_data(self, worker_id: int, data: Message) -> None:
+        assert data is None or not data.in_round
+        trained_round = self.__pending_models.finish(worker_id)
+        if trained_round == self._round_number:
+            self.__on_time_workers.add(worker_id)
+            if data is not None:
+                self.__on_time_update_num += 1
+                self.__algorithm.set_staleness(worker_id=worker_id, staleness=0)
+        elif data is None or self.__late_update_policy == "discard":
+            get_logger().debug(
+                "discard late data of round %s from worker %s",
+                trained_round,
+                worker_id,
+            )
+            data = None
+        else:
+            get_logger().debug(
+                "carry late update of round %s from worker %s",
+                trained_round,
+                worker_id,
+            )
+            self.__algorithm.set_staleness(
+                worker_id=worker_id, staleness=self._round_number - trained_round
+            )
+        if trained_round == self._round_number or data is not None:
+            self.__algorithm.process_worker_data(
+                worker_id=worker_id,
+                worker_data=data,
+                save_dir=self.config.get_save_dir(),
+                old_parameter_dict=self._model_cache.parameter_dict,
+            )
+            self.__try_close_semi_sync_round()
+        # A late worker skips the rounds closed while it was training
+        newest = self.__pending_models.pop_newest(worker_id)
+        if newest is not None:
+            round_number, result = newest
+            get_logger().debug(
+                "send the model of round %s to late worker %s", round_number, worker_id
+            )
+            self._endpoint.send(worker_id=worker_id, data=result)
+
+    def _get_wait_timeout(self) -> float | None:
+        if (
+            self.__round_deadline is None
+            or self.__on_time_update_num == 0
+            or self._round_number >= self.config.round
+        ):
+            return None
+        return max(
+            self.__round_deadline - self.__round_counter.elapsed_milliseconds() / 1000,
+            0,
+        )
+
+    def _on_wait_timeout(self) -> None:
+        if self.__semi_sync:
+            self.__try_close_semi_sync_round()
+
+    def __try_close_semi_sync_round(self) -> None:
+        if len(self.__on_time_workers) < self.worker_number:
+            # The last round waits for all workers so that no update is left behind
+            if (
+                self._round_number >= self.config.round
+                or self.__on_time_update_num == 0
+            ):
+                return
+            selected_workers = self._selected_workers
+            if not selected_workers:
+                selected_workers = set(range(self.worker_number))
+            quorum_reached = self.__quorum is not None and (
+                self.__on_time_update_num
+                >= math.ceil(self.__quorum * len(selected_workers))
+            )
+            deadline_passed = self.__round_deadline is not None and (
+                self.__round_counter.elapsed_milliseconds() / 1000
+                >= self.__round_deadline
+            )
+            if not quorum_reached and not deadline_passed:
+                return
+            missed_workers = sorted(selected_workers - self.__on_time_workers)
+            self.__missed_workers[self._round_number] = missed_workers
+            get_logger().warning(
+                "close round %s without workers %s",
+                self._round_number,
+                missed_workers,
+            )
+        result = self._aggregate_worker_data()
+        self.__on_time_workers.clear()
+        self.__on_time_update_num = 0
+        self.__send_semi_sync_result(result)
+        self.__round_counter.reset_start_time()
+
+    def __send_semi_sync_result(self, result: Message) -> None:
+        # Like _send_result, but a worker still training on an older model gets
+        # this one when it reports
+        self._before_send_result(result=result)
+        assert "worker_result" not in result.other_data
+        self._selected_workers = self._select_workers()
+        self._after_send_result(result=result)
+        for worker_id in range(self.worker_number):
+            data = result if worker_id in self._selected_workers else None
+            if self.__pending_models.offer(
+                worker_id=worker_id, round_number=self._round_number, data=data
+            ):
+                self._endpoint.send(worker_id=worker_id, data=data)
+
+    def __process_async_worker_data(self, worker_id: int, data: Message) -> None:
+        assert self.__async_buffer_size is not None
+        if worker_id in self.__stopped_workers:
+            return
+        if data is not None:
+            self.__algorithm.set_staleness(
+                worker_id=worker_id,
+                staleness=self._round_number
+                - self.__worker_model_round.get(worker_id, 1),
+            )
+            self.__algorithm.process_worker_data(
+                worker_id=worker_id,
+                worker_data=data,
+                save_dir=self.config.get_save_dir(),
+                old_parameter_dict=self._model_cache.parameter_dict,
+            )
+            self.__buffered_update_num += 1
+            self.__worker_update_num[worker_id] = (
+                self.__worker_update_num.get(worker_id, 0) + 1
+            )
+            if self.__worker_update_num[worker_id] >= self.config.round:
+                self.__stopped_workers.add(worker_id)
+        if self.__buffered_update_num >= self.__async_buffer_size or (
+            self.__buffered_update_num > 0
+            and len(self.__stopped_workers) == self.worker_number
+        ):
+            result = self._aggregate_worker_data()
+            self._before_send_result(result)
+            self._after_send_result(result)
+            self.__buffered_update_num = 0
+            if result.end_training:
+                # Workers still training are told to stop in their next replies
+                self.__async_end_training = True
+        if self.__async_end_training:
+            self.__stopped_workers.add(worker_id)
+        # The worker continues training on the newest global model immediately
+        self.__worker_model_round[worker_id] = self._round_number
+        self._endpoint.send(
+            worker_id=worker_id,
+            data=ParameterMessage(
+                parameter=self._model_cache.parameter_dict,
+                end_training=self.__async_end_training,
+            ),
+        )
+
     def _aggregate_worker_data(self) -> Any:
-        return self.__algorithm.aggregate_worker_data()
+        counter = TimeCounter()
+        result = self.__algorithm.aggregate_worker_data()
+        self.__aggregate_seconds += counter.elapsed_milliseconds() / 1000
+        return result
 
     def _before_send_result(self, result: Message) -> None:
         if not isinstance(result, ParameterMessageBase):
             return
         assert isinstance(result, ParameterMessage)
+        self.__apply_evaluations(wait=False)
         if self.need_init_performance:
             assert self.config.distribute_init_parameters
         if self.need_init_performance and "init" in result.other_data:
-            self.__record_compute_stat(result.parameter, keep_performance_logger=False)
-            self.__stat[0] = self.__stat.pop(1)
+            self.__record_compute_stat(
+                result.parameter, keep_performance_logger=False, stat_key=0
+            )
         elif self._compute_stat and "init" not in result.other_data:
-            self.__record_compute_stat(result.parameter)
-            if not result.end_training and self.early_stop and self._convergent():
-                result.end_training = True
+            self.__record_policy_compute_stat(result)
         elif result.end_training:
             self.__record_compute_stat(result.parameter)
-        model_path = os.path.join(
-            self.config.save_dir,
-            "aggregated_model",
-            f"round_{self.round_number}.pk",
+        if self.__convergent:
+            result.end_training = True
+        self._model_cache.cache_parameter_dict(result.parameter)
+        self.__checkpoint_writer.save_model(
+            self.round_number, self._model_cache.parameter_dict
         )
-        self._model_cache.cache_parameter_dict(result.parameter, model_path)
+        # Rounds with pending evaluations may still become the best round
+        evaluated_round = self.round_number
+        if self.__pending_evaluations:
+            evaluated_round = self.__pending_evaluations[0][2]["round_number"] - 1
+        self.__checkpoint_writer.set_evaluated_round(evaluated_round)
         # if "partial_parameter" in result:
         #     return
         # if self.config.limited_resource:
@@ -121,50 +433,179 @@ class AggregationServer(Server):
 
     def _after_send_result(self, result: Any) -> None:
         if isinstance(result, ParameterMessageBase) and not result.in_round:
+            round_timing = (
+                self._pop_timing()
+                | {
+                    "aggregate_seconds": self.__aggregate_seconds,
+                    "evaluate_seconds": self.__evaluate_seconds,
+                    "saved_evaluate_seconds": self.__saved_evaluate_seconds,
+                }
+                | self._endpoint.pop_transferred_bytes()
+            )
+            self.__aggregate_seconds = 0
+            self.__evaluate_seconds = 0
+            self.__saved_evaluate_seconds = 0
+            self.__round_timing[self._round_number] = round_timing
+            get_logger().info(
+                "round %s waits for workers %.3f seconds and works %.3f seconds",
+                self._round_number,
+                round_timing["wait_seconds"],
+                round_timing["work_seconds"],
+            )
             self._round_number += 1
         self.__algorithm.clear_worker_data()
 
     def _stopped(self) -> bool:
+        if self.__async_buffer_size is not None:
+            return len(self.__stopped_workers) == self.worker_number
         return self._round_number > self.config.round
 
     @property
     def performance_stat(self) -> dict:
+        self.__apply_evaluations(wait=True)
         return self.__stat
 
     def _get_stat_key(self):
         return self._round_number
 
+    def __record_policy_compute_stat(self, result: ParameterMessage) -> None:
+        final = result.end_training or self._round_number >= self.config.round
+        if not final and self._round_number % self.__evaluation_interval != 0:
+            self.__saved_evaluate_seconds += self.__full_evaluate_seconds
+            return
+        full = (
+            final
+            or self.__evaluation_sample_ratio is None
+            or (
+                self.__full_evaluation_interval is not None
+                and self._round_number % self.__full_evaluation_interval == 0
+            )
+        )
+        self.__record_compute_stat(
+            result.parameter,
+            check_convergence=full and not result.end_training and self.early_stop,
+            sampled=not full,
+        )
+
     def __record_compute_stat(
-        self, parameter_dict: TensorDict, keep_performance_logger: bool = True
+        self,
+        parameter_dict: TensorDict,
+        keep_performance_logger: bool = True,
+        stat_key: int | None = None,
+        check_convergence: bool = False,
+        sampled: bool = False,
     ) -> None:
-        self.tester.set_visualizer_prefix(f"round: {self._round_number},")
-        metric = self.get_metric(
-            parameter_dict, keep_performance_logger=keep_performance_logger
+        evaluation: dict = {
+            "key": self._get_stat_key() if stat_key is None else stat_key,
+            "round_number": self.round_number,
+            "elapsed_seconds": self.__counter.elapsed_milliseconds() / 1000,
+            "check_convergence": check_convergence,
+            "sampled": sampled,
+        }
+        evaluate_kwargs: dict = {
+            "keep_performance_logger": keep_performance_logger,
+            "visualizer_prefix": f"round: {self._round_number},",
+            "sampled": sampled,
+        }
+        if self.__evaluation_executor is None:
+            metric, seconds = self.__evaluate(parameter_dict, **evaluate_kwargs)
+            self.__apply_evaluation(parameter_dict, metric, seconds, **evaluation)
+            return
+        # The aggregated tensors are shared with the workers and the model cache
+        parameter_dict = {k: v.detach().clone() for k, v in parameter_dict.items()}
+        future = self.__evaluation_executor.submit(
+            self.__evaluate, parameter_dict, **evaluate_kwargs
         )
+        self.__pending_evaluations.append((future, parameter_dict, evaluation))
+
+    def __evaluate(
+        self, parameter_dict: TensorDict, **kwargs: Any
+    ) -> tuple[dict, float]:
+        counter = TimeCounter()
+        metric = self.get_metric(parameter_dict, **kwargs)
+        return metric, counter.elapsed_milliseconds() / 1000
+
+    def __apply_evaluations(self, wait: bool) -> None:
+        # _convergent reads performance_stat while an evaluation is applied
+        if self.__applying_evaluations:
+            return
+        self.__applying_evaluations = True
+        try:
+            while self.__pending_evaluations and (
+                wait or self.__pending_evaluations[0][0].done()
+            ):
+                future, parameter_dict, evaluation = (
+                    self.__pending_evaluations.popleft()
+                )
+                metric, seconds = future.result()
+                # Background evaluations are reported in the round they finish
+                self.__apply_evaluation(parameter_dict, metric, seconds, **evaluation)
+        finally:
+            self.__applying_evaluations = False
+
+    def __apply_evaluation(
+        self,
+        parameter_dict: TensorDict,
+        metric: dict,
+        seconds: float,
+        key: int,
+        round_number: int,
+        elapsed_seconds: float,
+        check_convergence: bool,
+        sampled: bool,
+    ) -> None:
+        self.__evaluate_seconds += seconds
         round_stat = {f"test_{k}": v for k, v in metric.items()}
+        round_stat["elapsed_seconds"] = elapsed_seconds
+        if sampled:
+            self.__saved_evaluate_seconds += max(
+                self.__full_evaluate_seconds - seconds, 0
+            )
+            round_stat |= self.__get_sampled_stat(round_stat["test_accuracy"])
+        else:
+            self.__full_evaluate_seconds = seconds
 
-        key = self._get_stat_key()
         assert key not in self.__stat
 
         self.__stat[key] = round_stat
-        with open(
-            os.path.join(self.save_dir, "round_record.json"),
-            "wt",
-            encoding="utf8",
-        ) as f:
-            json.dump(self.__stat, f)
+        self.__checkpoint_writer.append_round_record(key, round_stat)
+        if sampled:
+            return
+        self.__last_stat_key = key
 
-        max_acc = max(t["test_accuracy"] for t in self.__stat.values())
+        max_acc = max(t["test_accuracy"] for t in self.__full_stats())
         if max_acc > self.__max_acc:
             self.__max_acc = max_acc
-            with open(os.path.join(self.save_dir, "best_global_model.pk"), "wb") as f:
-                pickle.dump(
-                    parameter_dict,
-                    f,
-                )
+            # The models are saved by round number
+            self.__checkpoint_writer.save_best_model(
+                round_number, tensor_to(parameter_dict, device="cpu")
+            )
+        if check_convergence and not self.__convergent and self._convergent():
+            # With asynchronous evaluation the training stops at the next round
+            self.__convergent = True
+
+    def __get_sampled_stat(self, accuracy: float) -> dict:
+        # The normal approximation of the 95% confidence interval of the accuracy
+        # on the whole test set
+        sample_number = self.test_sample_number
+        half_width = 1.96 * math.sqrt(accuracy * (1 - accuracy) / sample_number)
+        return {
+            "test_sample_number": sample_number,
+            "test_accuracy_interval": [
+                max(accuracy - half_width, 0),
+                min(accuracy + half_width, 1),
+            ],
+        }
+
+    def __full_stats(self) -> list[dict]:
+        return [t for t in self.__stat.values() if "test_sample_number" not in t]
 
     def _convergent(self) -> bool:
-        max_acc = max(t["test_accuracy"] for t in self.performance_stat.values())
+        self.__apply_evaluations(wait=True)
+        # Sampled evaluations do not decide the convergence
+        if self.__last_stat_key is None:
+            return False
+        max_acc = max(t["test_accuracy"] for t in self.__full_stats())
         diff = 0.001
         if max_acc > self.__max_acc + diff:
             self.__max_acc = max_acc
@@ -175,7 +616,7 @@ class AggregationServer(Server):
             "max acc is %s diff is %s",
             self.__max_acc,
             self.__max_acc
-            - self.performance_stat[self._get_stat_key()]["test_accuracy"],
+            - self.__stat[self.__last_stat_key]["test_accuracy"],
         )
         self.__plateau += 1
         get_logger().error("plateau is %s", self.__plateau)
@@ -1,20 +1,24 @@
-import copy
 import functools
+import math
 import os
 import pickle
 import random
+import threading
 from typing import Any
 
-import gevent
-import gevent.lock
+import torch
 from cyy_naive_lib.log import get_logger
-from cyy_naive_lib.topology.cs_endpoint import ServerEndpoint
+from cyy_naive_lib.time_counter import TimeCounter
+from cyy_torch_toolbox.dataset import get_dataset_collection_sampler
 from cyy_torch_toolbox.inferencer import Inferencer
 from cyy_torch_toolbox.ml_type import MachineLearningPhase
 from cyy_torch_toolbox.typing import TensorDict
 
 from ..executor import Executor
 from ..message import Message, ParameterMessage
+from ..topology.endpoint import ServerEndpoint
+from ..util.batched_evaluator import BatchedEvaluator
+from ..util.evaluator_pool import create_tester
 
 
 class Server(Executor):
@@ -24,6 +28,16 @@ class Server(Executor):
             name = f"server of {task_id}"
         super().__init__(**kwargs, name=name)
         self._endpoint: ServerEndpoint = endpoint
+        self.__wait_seconds: float = 0
+        self.__work_seconds: float = 0
+        self.__work_counter: TimeCounter | None = None
+        self._selected_workers: set = set()
+        # The tester may be used by a background evaluation thread, gevent locks
+        # only work among the greenlets of one thread
+        self.__tester_lock = threading.Lock()
+        self.test_sample_number: int = 0
+        self.__test_chunk_number: int = 0
+        self.__test_chunk_indices: list[list[int]] = []
 
     @property
     def worker_number(self) -> int:
@@ -31,64 +45,199 @@ class Server(Executor):
 
     @functools.cached_property
     def tester(self) -> Inferencer:
-        tester = self.config.create_inferencer(phase=MachineLearningPhase.Test)
-        tester.dataset_collection.remove_dataset(phase=MachineLearningPhase.Training)
-        tester.dataset_collection.remove_dataset(phase=MachineLearningPhase.Validation)
-        tester.hook_config.summarize_executor = False
+        return create_tester(self.config)
+
+    @functools.cached_property
+    def sampled_tester(self) -> Inferencer:
+        # A fixed part of the test set with the same label distribution
+        sample_ratio: float = self.config.algorithm_kwargs["evaluation_sample_ratio"]
+        assert 0 < sample_ratio < 1
+        tester = create_tester(self.config)
+        sampler = get_dataset_collection_sampler(
+            name="iid",
+            dataset_collection=tester.dataset_collection,
+            part_number=round(1 / sample_ratio),
+        )
+        sampler.sample(part_id=0)
+        self.test_sample_number = len(
+            sampler._dataset_indices[MachineLearningPhase.Test][0]
+        )
+        get_logger().info(
+            "evaluate on %s sampled test samples", self.test_sample_number
+        )
         return tester
 
     def get_metric(
         self,
         parameter_dict: TensorDict | ParameterMessage,
         keep_performance_logger: bool = True,
+        visualizer_prefix: str | None = None,
+        sampled: bool = False,
     ) -> dict:
         if isinstance(parameter_dict, ParameterMessage):
             parameter_dict = parameter_dict.parameter
-        self.tester.model_util.load_parameter_dict(parameter_dict)
-        self.tester.model_util.disable_running_stats()
-        self.tester.set_device(self._get_device())
-        self.tester.hook_config.log_performance_metric = keep_performance_logger
-        self.tester.inference()
-        metric: dict = self.tester.performance_metric.get_epoch_metrics(1)
-        self._release_device_lock()
-        self.tester.offload_from_device()
+        with self.__tester_lock:
+            tester = self.sampled_tester if sampled else self.tester
+            if visualizer_prefix is not None:
+                tester.set_visualizer_prefix(visualizer_prefix)
+            tester.model_util.load_parameter_dict(parameter_dict)
+            tester.model_util.disable_running_stats()
+            tester.set_device(self._get_device())
+            tester.hook_config.log_performance_metric = keep_performance_logger
+            tester.inference()
+            metric: dict = tester.performance_metric.get_epoch_metrics(1)
+            self._release_device_lock()
+            tester.offload_from_device()
         return metric
 
+    def get_batched_accuracies(self, parameter_dicts: list[TensorDict]) -> list[float]:
+        # Only the top-1 accuracy is computed, in one pass over the test set
+        if not BatchedEvaluator.can_evaluate(self.tester):
+            return [
+                float(
+                    self.get_metric(parameter_dict, keep_performance_logger=False)[
+                        "accuracy"
+                    ]
+                )
+                for parameter_dict in parameter_dicts
+            ]
+        with self.__tester_lock:
+            device = self._get_device()
+            self.tester.set_device(device)
+            self.tester.model_util.disable_running_stats()
+            accuracies = BatchedEvaluator.from_tester(
+                self.tester, device=device
+            ).get_accuracies(parameter_dicts)
+            self._release_device_lock()
+            self.tester.offload_from_device()
+        return accuracies
+
+    def __get_test_chunk_dataloader(
+        self, chunk_id: int, chunk_number: int
+    ) -> torch.utils.data.DataLoader:
+        # The test set is split into parts with the same label distribution, the
+        # parts are read through the dataloader of the tester
+        if self.__test_chunk_number != chunk_number:
+            sampler = get_dataset_collection_sampler(
+                name="iid",
+                dataset_collection=self.tester.dataset_collection,
+                part_number=chunk_number,
+            )
+            self.__test_chunk_indices = [
+                sorted(sampler._dataset_indices[MachineLearningPhase.Test][part_id])
+                for part_id in range(chunk_number)
+            ]
+            self.__test_chunk_number = chunk_number
+        dataloader = self.tester.dataloader
+        return torch.utils.data.DataLoader(
+            dataloader.dataset,
+            batch_size=dataloader.batch_size,
+            sampler=self.__test_chunk_indices[chunk_id],
+            collate_fn=dataloader.collate_fn,
+            pin_memory=dataloader.pin_memory,
+        )
+
+    def get_adaptive_accuracies(
+        self, parameter_dicts: list[TensorDict], tolerance: float, chunk_number: int
+    ) -> list[float]:
+        # Evaluate on more chunks of the test set until the 95% confidence interval
+        # of each accuracy is narrower than the tolerance on each side. If it never
+        # is, the chunks add up to the whole test set.
+        if not BatchedEvaluator.can_evaluate(self.tester):
+            return self.get_batched_accuracies(parameter_dicts)
+        correct_counts: list[int] = [0] * len(parameter_dicts)
+        sample_numbers: list[int] = [0] * len(parameter_dicts)
+        unfinished: list[int] = list(range(len(parameter_dicts)))
+        with self.__tester_lock:
+            device = self._get_device()
+            self.tester.set_device(device)
+            self.tester.model_util.disable_running_stats()
+            for chunk_id in range(chunk_number):
+                chunk_counts, chunk_sample_number = BatchedEvaluator.from_tester(
+                    self.tester,
+                    device=device,
+                    dataloader=self.__get_test_chunk_dataloader(
+                        chunk_id, chunk_number
+                    ),
+                ).get_correct_counts([parameter_dicts[i] for i in unfinished])
+                for i, count in zip(unfinished, chunk_counts):
+                    correct_counts[i] += count
+                    sample_numbers[i] += chunk_sample_number
+                # The Agresti-Coull interval is not empty when no or all samples
+                # are correct
+                unfinished = [
+                    i
+                    for i in unfinished
+                    if 1.96
+                    * math.sqrt(
+                        (correct_counts[i] + 2)
+                        * (sample_numbers[i] - correct_counts[i] + 2)
+                        / (sample_numbers[i] + 4) ** 3
+                    )
+                    > tolerance
+                ]
+                if not unfinished:
+                    break
+            self._release_device_lock()
+            self.tester.offload_from_device()
+        return [
+            count / sample_number
+            for count, sample_number in zip(correct_counts, sample_numbers)
+        ]
+
     def start(self) -> None:
         with self._get_execution_context():
             with open(os.path.join(self.save_dir, "config.pkl"), "wb") as f:
                 pickle.dump(self.config, f)
             self._before_start()
 
-        worker_set: set = set()
+        assert self._endpoint.worker_num == self.config.worker_number
+        worker_ids: set = set(range(self._endpoint.worker_num))
         while not self._stopped():
-            if not worker_set:
-                worker_set = set(range(self._endpoint.worker_num))
+            counter = TimeCounter()
+            ready_worker_ids = self._endpoint.wait_data(
+                worker_ids=worker_ids, timeout=self._get_wait_timeout()
+            )
+            self.__wait_seconds += counter.elapsed_milliseconds() / 1000
+            self.__work_counter = TimeCounter()
             with self._get_execution_context():
-                assert self._endpoint.worker_num == self.config.worker_number
-                for worker_id in copy.copy(worker_set):
-                    has_data: bool = self._endpoint.has_data(worker_id)
-                    if has_data:
-                        get_logger().debug(
-                            "get result from %s worker_num %s",
-                            worker_id,
-                            self._endpoint.worker_num,
-                        )
-                        self._process_worker_data(
-                            worker_id, self._endpoint.get(worker_id=worker_id)
-                        )
-                        worker_set.remove(worker_id)
-                if worker_set:
-                    get_logger().debug("wait workers %s", worker_set)
-
-            if worker_set and not self._stopped():
-                gevent.sleep(1)
+                if not ready_worker_ids:
+                    self._on_wait_timeout()
+                for worker_id in sorted(ready_worker_ids):
+                    get_logger().debug(
+                        "get result from %s worker_num %s",
+                        worker_id,
+                        self._endpoint.worker_num,
+                    )
+                    self._process_worker_data(
+                        worker_id, self._endpoint.get(worker_id=worker_id)
+                    )
+            self.__work_seconds += self.__work_counter.elapsed_milliseconds() / 1000
+            self.__work_counter = None
 
         with self._get_execution_context():
             self._endpoint.close()
             self._server_exit()
             get_logger().debug("end server")
 
+    def _pop_timing(self) -> dict:
+        if self.__work_counter is not None:
+            self.__work_seconds += self.__work_counter.elapsed_milliseconds() / 1000
+            self.__work_counter.reset_start_time()
+        timing = {
+            "wait_seconds": self.__wait_seconds,
+            "work_seconds": self.__work_seconds,
+        }
+        self.__wait_seconds = 0
+        self.__work_seconds = 0
+        return timing
+
+    def _get_wait_timeout(self) -> float | None:
+        return None
+
+    def _on_wait_timeout(self) -> None:
+        pass
+
     def _before_start(self) -> None:
         pass
 
@@ -113,6 +262,7 @@ class Server(Executor):
 
         selected_workers = self._select_workers()
         get_logger().debug("choose workers %s", selected_workers)
+        self._selected_workers = selected_workers
         if selected_workers:
             self._endpoint.broadcast(data=result, worker_ids=selected_workers)
         unselected_workers = set(range(self.worker_number)) - selected_workers
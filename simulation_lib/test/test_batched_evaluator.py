@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+
+import torch
+from cyy_torch_toolbox.device import get_device
+
+from ..config import DistributedTrainingConfig, load_config_from_file
+from ..device_scheduler import DeviceMemoryScheduler
+from ..server.server import Server
+from ..util.batched_evaluator import BatchedEvaluator
+from ..util.evaluator_pool import create_tester
+
+
+def _load_mnist_config() -> DistributedTrainingConfig:
+    return load_config_from_file(
+        os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            "..",
+            "..",
+            "conf",
+            "fed_avg",
+            "mnist.yaml",
+        )
+    )
+
+
+def test_batched_accuracy_of_small_model() -> None:
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(
+        torch.nn.Linear(8, 16), torch.nn.ReLU(), torch.nn.Linear(16, 3)
+    )
+    dataloader = [(torch.randn(10, 8), torch.randint(0, 3, (10,))) for _ in range(5)]
+    parameter_dicts = []
+    for _ in range(4):
+        for p in model.parameters():
+            torch.nn.init.normal_(p)
+        parameter_dicts.append(
+            {k: v.detach().clone() for k, v in model.named_parameters()}
+        )
+    accuracies = BatchedEvaluator(
+        model=model, dataloader=dataloader, device=torch.device("cpu")
+    ).get_accuracies(parameter_dicts)
+    for parameter_dict, accuracy in zip(parameter_dicts, accuracies):
+        model.load_state_dict(parameter_dict)
+        correct_count = 0
+        with torch.no_grad():
+            for inputs, targets in dataloader:
+                correct_count += int((model(inputs).argmax(dim=-1) == targets).sum())
+        assert accuracy == correct_count / 50
+
+
+def test_batched_accuracy_of_tester() -> None:
+    tester = create_tester(_load_mnist_config())
+    tester.hook_config.log_performance_metric = False
+    device = get_device()
+    tester.set_device(device)
+    tester.model_util.disable_running_stats()
+    parameter_dict = tester.model_util.get_parameter_dict()
+    tester.inference()
+    accuracy = tester.performance_metric.get_epoch_metrics(1)["accuracy"]
+    batched_accuracy = BatchedEvaluator.from_tester(
+        tester, device=device
+    ).get_accuracies([parameter_dict])[0]
+    assert abs(float(accuracy) - batched_accuracy) < 1e-6
+
+
+def test_batched_accuracies_of_server() -> None:
+    server = Server(
+        task_id=None,
+        endpoint=None,
+        config=_load_mnist_config(),
+        device_scheduler=DeviceMemoryScheduler(
+            manager=multiprocessing.Manager(), budget=None
+        ),
+    )
+    torch.manual_seed(0)
+    parameter_dict = server.tester.model_util.get_parameter_dict()
+    # Models like the subset models of several workers
+    parameter_dicts = [
+        {k: v + 0.01 * torch.randn_like(v) for k, v in parameter_dict.items()}
+        for _ in range(3)
+    ]
+    batched_accuracies = server.get_batched_accuracies(parameter_dicts)
+    for p, batched_accuracy in zip(parameter_dicts, batched_accuracies):
+        accuracy = server.get_metric(p, keep_performance_logger=False)["accuracy"]
+        assert abs(float(accuracy) - batched_accuracy) < 1e-6
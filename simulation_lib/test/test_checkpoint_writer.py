@@ -0,0 +1,67 @@
+import json
+import os
+import pickle
+
+from ..util.checkpoint_writer import CheckpointWriter
+
+
+def test_retention_and_order(tmp_path) -> None:
+    model_dir = os.path.join(tmp_path, "model")
+    writer = CheckpointWriter(
+        model_dir=model_dir, save_dir=str(tmp_path), keep_last=2, keep_every=3
+    )
+    for round_number in range(1, 8):
+        writer.save_model(round_number, {"round": round_number})
+        if round_number == 2:
+            writer.save_best_model(round_number, {"round": round_number})
+        writer.append_round_record(round_number, {"accuracy": round_number / 10})
+    writer.close()
+    # The last two rounds, every third round and the best round are kept
+    assert sorted(os.listdir(model_dir)) == [
+        f"round_{round_number}.pk" for round_number in (2, 3, 6, 7)
+    ]
+    for round_number in (2, 3, 6, 7):
+        with open(os.path.join(model_dir, f"round_{round_number}.pk"), "rb") as f:
+            assert pickle.load(f) == {"round": round_number}
+    with open(os.path.join(tmp_path, "best_global_model.pk"), "rb") as f:
+        assert pickle.load(f) == {"round": 2}
+    with open(os.path.join(tmp_path, "round_record.jsonl"), "rt", encoding="utf8") as f:
+        records = [json.loads(line) for line in f]
+    assert records == [
+        {"round": round_number, "accuracy": round_number / 10}
+        for round_number in range(1, 8)
+    ]
+
+
+def test_keep_all(tmp_path) -> None:
+    writer = CheckpointWriter(model_dir=str(tmp_path), save_dir=str(tmp_path))
+    for round_number in range(1, 4):
+        writer.save_model(round_number, {"round": round_number})
+    writer.wait()
+    assert sorted(os.listdir(tmp_path)) == [
+        f"round_{round_number}.pk" for round_number in range(1, 4)
+    ]
+    writer.close()
+
+
+def test_pruning_waits_for_evaluation(tmp_path) -> None:
+    writer = CheckpointWriter(
+        model_dir=str(tmp_path), save_dir=str(tmp_path), keep_last=1
+    )
+    # Another writer of the directory
+    open(os.path.join(tmp_path, "round_0.pk"), "wb").close()
+    for round_number in range(1, 4):
+        writer.save_model(round_number, {"round": round_number})
+        writer.set_evaluated_round(1)
+    writer.wait()
+    assert sorted(os.listdir(tmp_path)) == ["round_0.pk", "round_2.pk", "round_3.pk"]
+    # Round 2 turns out to be the best one
+    writer.save_best_model(2, {"round": 2})
+    writer.set_evaluated_round(3)
+    writer.close()
+    assert sorted(os.listdir(tmp_path)) == [
+        "best_global_model.pk",
+        "round_0.pk",
+        "round_2.pk",
+        "round_3.pk",
+    ]
@@ -0,0 +1,24 @@
+import numpy
+
+from ..util.dataset_store import SharedDatasetStore
+
+
+def _create_object(value: float) -> dict:
+    return {"array": numpy.full(1024 * 1024, value), "name": str(value)}
+
+
+def test_evicted_store_is_rebuilt(tmp_path) -> None:
+    stores = [
+        SharedDatasetStore(key=i, store_dir=str(tmp_path), max_store_bytes=0)
+        for i in range(2)
+    ]
+    obj = stores[0].get(lambda: _create_object(0))
+    assert obj["name"] == "0"
+    assert isinstance(obj["array"], numpy.memmap)
+    # Building the second store removes the first one
+    assert stores[1].get(lambda: _create_object(1))["name"] == "1"
+    # The removed files stay mapped
+    assert float(obj["array"].sum()) == 0
+    obj = stores[0].get(lambda: _create_object(2))
+    assert obj["name"] == "2"
+    assert float(obj["array"][0]) == 2
@@ -0,0 +1,20 @@
+import torch
+
+from ..algorithm.fed_avg_algorithm import FedAVGAlgorithm
+from ..message import ParameterMessage
+
+
+def test_stale_update_blend() -> None:
+    global_parameter = {"a": torch.zeros(4)}
+    worker_parameter = {"a": torch.ones(4)}
+    algorithm = FedAVGAlgorithm()
+    algorithm.set_staleness(worker_id=0, staleness=3)
+    algorithm.process_worker_data(
+        worker_id=0,
+        worker_data=ParameterMessage(parameter=worker_parameter, dataset_size=2),
+        old_parameter_dict=global_parameter,
+        save_dir="",
+    )
+    result = algorithm.aggregate_worker_data()
+    # A single stale update only moves the global model by its staleness factor
+    assert torch.allclose(result.parameter["a"], torch.full((4,), 0.5), atol=1e-5)
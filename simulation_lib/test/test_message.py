@@ -0,0 +1,27 @@
+import torch
+
+from ..message import MaskedParameterMessage, pack_mask, unpack_mask
+
+
+def test_mask_round_trip() -> None:
+    torch.manual_seed(0)
+    for shape in [(1,), (7,), (9,), (3, 5), (2, 3, 7), (64,)]:
+        mask = torch.rand(shape) >= 0.5
+        packed_mask = pack_mask(mask)
+        assert packed_mask.dtype == torch.uint8
+        assert packed_mask.numel() == (mask.numel() + 7) // 8
+        assert torch.equal(unpack_mask(packed_mask, mask.shape), mask)
+
+
+def test_masked_message() -> None:
+    parameter = torch.arange(15, dtype=torch.float).view(3, 5)
+    mask = parameter.remainder(3) == 0
+    message = MaskedParameterMessage(
+        values={"a": parameter[mask]},
+        masks={"a": pack_mask(mask)},
+        shapes={"a": parameter.shape},
+    )
+    assert torch.equal(message.get_mask("a"), mask)
+    restored = torch.zeros_like(parameter)
+    restored[message.get_mask("a")] = message.values["a"]
+    assert torch.equal(restored, parameter * mask)
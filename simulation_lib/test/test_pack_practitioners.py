@@ -0,0 +1,75 @@
+import json
+import os
+from types import SimpleNamespace
+
+from ..algorithm_factory import pack_practitioners
+from ..practitioner import Practitioner
+
+
+class _SizedPractitioner(Practitioner):
+    def __init__(self, practitioner_id: int, training_set_size: int) -> None:
+        super().__init__(practitioner_id=practitioner_id)
+        self.__training_set_size = training_set_size
+
+    def get_training_set_size(self, name: str) -> int:
+        return self.__training_set_size
+
+
+def _create_config(parallel_number: int, worker_cost_dir: str = "") -> SimpleNamespace:
+    return SimpleNamespace(
+        parallel_number=parallel_number,
+        worker_cost_dir=worker_cost_dir,
+        dc_config=SimpleNamespace(dataset_name="dataset"),
+    )
+
+
+def _get_loads(assignment: dict, costs: dict) -> list:
+    return sorted(
+        sum(costs[practitioner.id] for practitioner in practitioners)
+        for practitioners in assignment.values()
+    )
+
+
+def test_lpt_balance() -> None:
+    costs = {i: size for i, size in enumerate([10, 9, 8, 7, 6, 5, 4])}
+    practitioners = [_SizedPractitioner(i, size) for i, size in costs.items()]
+    assignment = pack_practitioners(_create_config(3), practitioners)
+    assigned_ids = sorted(
+        practitioner.id
+        for practitioners in assignment.values()
+        for practitioner in practitioners
+    )
+    assert assigned_ids == list(costs.keys())
+    # 10+5+4, 9+6 and 8+7
+    assert _get_loads(assignment, costs) == [15, 15, 19]
+    assert sorted(p.id for p in assignment[0]) == [0, 5, 6]
+
+
+def test_more_processes_than_workers() -> None:
+    practitioners = [_SizedPractitioner(i, 1) for i in range(2)]
+    assignment = pack_practitioners(_create_config(4), practitioners)
+    assert sorted(len(v) for v in assignment.values()) == [1, 1]
+
+
+def test_measured_costs(tmp_path) -> None:
+    # Practitioner 0 was measured slow and practitioner 1 fast, their datasets
+    # have the same size
+    for practitioner_id, epoch_seconds in ((0, [15]), (1, [4, 6])):
+        worker_dir = os.path.join(tmp_path, f"worker_{practitioner_id}")
+        os.makedirs(worker_dir)
+        with open(
+            os.path.join(worker_dir, "epoch_time.json"), "wt", encoding="utf8"
+        ) as f:
+            json.dump(
+                {"practitioner_id": practitioner_id, "epoch_seconds": epoch_seconds},
+                f,
+            )
+    practitioners = [_SizedPractitioner(i, 10) for i in range(3)]
+    assignment = pack_practitioners(
+        _create_config(2, worker_cost_dir=str(tmp_path)), practitioners
+    )
+    # Practitioner 2 is estimated to take 10 seconds from the measured ones
+    assert sorted(sorted(p.id for p in v) for v in assignment.values()) == [
+        [0],
+        [1, 2],
+    ]
@@ -0,0 +1,104 @@
+import pytest
+import torch
+
+from ..algorithm.aggregation_algorithm import AggregationAlgorithm
+from ..algorithm.parameter_accumulator import ParameterAccumulator
+from ..message import ParameterMessage
+
+
+def _create_worker_data(shapes: dict, worker_number: int) -> dict:
+    torch.manual_seed(0)
+    return {
+        worker_id: ParameterMessage(
+            parameter={k: torch.randn(shape) for k, shape in shapes.items()},
+            dataset_size=worker_id + 1,
+        )
+        for worker_id in range(worker_number)
+    }
+
+
+def _get_reference(worker_data: dict) -> dict:
+    return AggregationAlgorithm.weighted_avg(
+        worker_data, AggregationAlgorithm.get_ratios(worker_data)
+    )
+
+
+def _accumulate(worker_data: dict, thread_number: int) -> dict:
+    accumulator = ParameterAccumulator(thread_number=thread_number)
+    for data in worker_data.values():
+        accumulator.add(data.parameter, data.dataset_size)
+    return accumulator.pop()
+
+
+def test_add() -> None:
+    worker_data = _create_worker_data({"a": (3, 4), "b": (5,)}, worker_number=3)
+    result = _accumulate(worker_data, thread_number=1)
+    reference = _get_reference(worker_data)
+    assert result.keys() == reference.keys()
+    for k, v in reference.items():
+        assert result[k].dtype == v.dtype
+        assert torch.allclose(result[k], v, atol=1e-5)
+
+
+def test_sharded_add() -> None:
+    # Big enough for three shards, parameter "a" spans the first two
+    worker_data = _create_worker_data({"a": (300, 500), "b": (100000,)}, 4)
+    accumulator = ParameterAccumulator(thread_number=4)
+    # The buffer is reused by the next round
+    for _ in range(2):
+        for data in worker_data.values():
+            accumulator.add(data.parameter, data.dataset_size)
+        result = accumulator.pop()
+        single_thread_result = _accumulate(worker_data, thread_number=1)
+        for k, v in _get_reference(worker_data).items():
+            assert torch.equal(result[k], single_thread_result[k])
+            assert torch.allclose(result[k], v, atol=1e-5)
+
+
+def test_uncounted_add() -> None:
+    # A delta base shares the weight of the deltas
+    base = {"a": torch.randn(4)}
+    deltas = [{"a": torch.randn(4)} for _ in range(2)]
+    accumulator = ParameterAccumulator()
+    for delta in deltas:
+        accumulator.add(delta, 2)
+    accumulator.add(base, 4, count_weight=False)
+    result = accumulator.pop()
+    assert torch.allclose(
+        result["a"], base["a"] + (deltas[0]["a"] + deltas[1]["a"]) / 2, atol=1e-5
+    )
+
+
+def test_add_masked() -> None:
+    torch.manual_seed(0)
+    shapes = {"a": torch.Size((3, 5)), "b": torch.Size((7,))}
+    parameters = [{k: torch.randn(shape) for k, shape in shapes.items()}]
+    parameters.append({k: torch.randn(shape) for k, shape in shapes.items()})
+    masks = [{k: torch.rand(shape) >= 0.5 for k, shape in shapes.items()}]
+    masks.append({k: torch.rand(shape) >= 0.5 for k, shape in shapes.items()})
+    weights = [1.0, 3.0]
+    accumulator = ParameterAccumulator()
+    for parameter, mask, weight in zip(parameters, masks, weights):
+        accumulator.add_masked(
+            values={k: v[mask[k]] for k, v in parameter.items()},
+            masks=mask,
+            shapes=shapes,
+            weight=weight,
+        )
+    result = accumulator.pop()
+    for k in shapes:
+        weighted_sum = sum(
+            p[k] * m[k] * w for p, m, w in zip(parameters, masks, weights)
+        )
+        total_weight = sum(m[k] * w for m, w in zip(masks, weights))
+        # Elements that no worker kept are zero
+        reference = weighted_sum / torch.where(total_weight == 0, 1, total_weight)
+        assert torch.allclose(result[k], reference, atol=1e-5)
+
+
+def test_nan_check() -> None:
+    accumulator = ParameterAccumulator()
+    accumulator.add({"a": torch.tensor([1.0, float("nan")])}, 1)
+    with pytest.raises(AssertionError):
+        accumulator.pop()
+
@@ -0,0 +1,41 @@
+from ..util.pending_models import PendingModels
+
+
+def test_always_late_worker() -> None:
+    # Workers 0 and 1 report every round, worker 2 needs three rounds per model
+    pending_models = PendingModels(worker_ids=range(3), first_round=1)
+    received: dict[int, list[int]] = {worker_id: [1] for worker_id in range(3)}
+    stalenesses: list[int] = []
+    for round_number in range(1, 31):
+        for worker_id in (0, 1):
+            assert pending_models.finish(worker_id) == round_number
+        if round_number % 3 == 0:
+            trained_round = pending_models.finish(2)
+            assert trained_round == received[2][-1]
+            stalenesses.append(round_number - trained_round)
+            newest = pending_models.pop_newest(2)
+            assert newest is not None
+            assert newest[0] == round_number
+            assert newest[1] == f"model {round_number}"
+            received[2].append(newest[0])
+        for worker_id in range(3):
+            if pending_models.offer(
+                worker_id=worker_id,
+                round_number=round_number + 1,
+                data=f"model {round_number + 1}",
+            ):
+                received[worker_id].append(round_number + 1)
+    # The late worker skips to the newest model, so it never falls further behind
+    assert max(stalenesses) <= 3
+    assert len(received[2]) == 11
+    assert received[0] == list(range(1, 32))
+
+
+def test_idle_worker_gets_model_at_once() -> None:
+    pending_models = PendingModels(worker_ids=range(1), first_round=1)
+    assert not pending_models.offer(worker_id=0, round_number=2, data=None)
+    assert pending_models.finish(0) == 1
+    assert pending_models.offer(worker_id=0, round_number=3, data=None)
+    # The older model was replaced by the one sent
+    assert pending_models.pop_newest(0) is None
+    assert pending_models.finish(0) == 3
@@ -0,0 +1,58 @@
+import torch
+
+from ..algorithm.fed_avg_algorithm import FedAVGAlgorithm
+from ..message import Message, ParameterMessage
+from ..worker.pre_aggregator import PreAggregator
+
+
+def _create_message(worker_id: int) -> ParameterMessage:
+    return ParameterMessage(
+        parameter={
+            "a": torch.full((3, 2), float(worker_id)),
+            "b": torch.arange(4, dtype=torch.float) * worker_id,
+        },
+        dataset_size=worker_id + 1,
+    )
+
+
+def _aggregate(messages: dict) -> dict:
+    algorithm = FedAVGAlgorithm()
+    for worker_id, message in messages.items():
+        algorithm.process_worker_data(
+            worker_id=worker_id,
+            worker_data=message,
+            old_parameter_dict=None,
+            save_dir="",
+        )
+    return algorithm.aggregate_worker_data().parameter
+
+
+def test_pre_aggregation_equals_fed_avg() -> None:
+    # Workers 0-2 share a process, workers 3 and 4 upload alone
+    pre_aggregator = PreAggregator(worker_ids=range(3))
+    results = [pre_aggregator.submit(i, _create_message(i)) for i in range(3)]
+    assert results[:2] == [None, None]
+    combined = results[2]
+    assert isinstance(combined, ParameterMessage)
+    assert combined.dataset_size == 6
+    assert combined.other_data.pop("pre_aggregated_worker_ids") == [0, 1, 2]
+    pre_aggregated = _aggregate(
+        {0: combined, 3: _create_message(3), 4: _create_message(4)}
+    )
+    flat = _aggregate({i: _create_message(i) for i in range(5)})
+    for k, v in flat.items():
+        assert torch.allclose(pre_aggregated[k], v, atol=1e-6)
+
+
+def test_skipped_workers() -> None:
+    pre_aggregator = PreAggregator(worker_ids=range(2))
+    assert pre_aggregator.submit(0, None) is None
+    result = pre_aggregator.submit(1, _create_message(1))
+    assert isinstance(result, ParameterMessage)
+    assert result.dataset_size == 2
+    assert torch.equal(result.parameter["a"], _create_message(1).parameter["a"])
+    # The next round starts empty
+    assert pre_aggregator.submit(0, None) is None
+    result = pre_aggregator.submit(1, None)
+    assert type(result) is Message
+    assert result.other_data["pre_aggregated_worker_ids"] == [0, 1]
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import torch
+
+from ..algorithm.fed_avg_algorithm import FedAVGAlgorithm
+from ..message import ParameterMessage
+from ..method.shapley_value.shapley_value_algorithm import \
+    ShapleyValueAlgorithm
+
+# Extensions of the empty prefix come first in a new round
+_subsets: list[list[int]] = [[0], [0, 1], [0, 1, 2], [2], [1, 2], [1]]
+
+
+class _Server:
+    def __init__(self) -> None:
+        self.config = SimpleNamespace(algorithm_kwargs={}, round=3, save_dir="")
+        self.round_number = 1
+        self.parameter_dicts: list[dict] = []
+
+    def get_metric(self, parameter_dict: dict, keep_performance_logger: bool) -> dict:
+        self.parameter_dicts.append(
+            {k: v.clone() for k, v in parameter_dict.items()}
+        )
+        return {"accuracy": 0}
+
+
+class _SubsetAlgorithm(ShapleyValueAlgorithm):
+    def _compute_shapley_values(self) -> None:
+        for subset in _subsets:
+            self._get_subset_metric(subset)
+        self.shapley_values_S[self._server.round_number] = {}
+
+
+def test_subset_parameters_of_several_rounds() -> None:
+    torch.manual_seed(0)
+    server = _Server()
+    algorithm = _SubsetAlgorithm(sv_algorithm_cls=None, server=server)
+    for round_number in range(1, 4):
+        server.round_number = round_number
+        server.parameter_dicts.clear()
+        worker_data = {
+            worker_id: ParameterMessage(
+                parameter={"a": torch.randn(3, 2), "b": torch.randn(4)},
+                dataset_size=worker_id + 1,
+            )
+            for worker_id in range(3)
+        }
+        for worker_id, data in worker_data.items():
+            algorithm.process_worker_data(
+                worker_id=worker_id,
+                worker_data=ParameterMessage(
+                    parameter=dict(data.parameter), dataset_size=data.dataset_size
+                ),
+                old_parameter_dict=None,
+                save_dir="",
+            )
+        algorithm.aggregate_worker_data()
+        algorithm.clear_worker_data()
+        assert len(server.parameter_dicts) == len(_subsets)
+        for subset, parameter_dict in zip(_subsets, server.parameter_dicts):
+            reference = FedAVGAlgorithm._aggregate_worker_data(
+                {worker_id: worker_data[worker_id] for worker_id in subset}
+            ).parameter
+            for k, v in reference.items():
+                assert torch.allclose(parameter_dict[k], v, atol=1e-6)
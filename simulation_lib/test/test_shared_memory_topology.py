@@ -0,0 +1,77 @@
+import gc
+
+import torch
+from cyy_torch_toolbox.data_structure.torch_process_context import \
+    TorchProcessContext
+
+from ..topology.shared_memory_topology import (SharedMemoryCentralTopology,
+                                               _ArenaMessage, _get_arena)
+
+
+def _create_data() -> dict:
+    return {
+        "parameter": {
+            "weight": torch.randn(64, 32),
+            "bias": torch.arange(1024, dtype=torch.int64),
+            # Pickled inline
+            "scale": torch.ones(2),
+        },
+        "round": 3,
+    }
+
+
+def test_round_trip() -> None:
+    topology = SharedMemoryCentralTopology(
+        mp_context=TorchProcessContext(), worker_num=2
+    )
+    data = _create_data()
+    topology.send_to_worker(1, data)
+    received = topology.get_from_server(1)
+    assert received["round"] == 3
+    for k, v in data["parameter"].items():
+        assert received["parameter"][k].dtype == v.dtype
+        assert torch.equal(received["parameter"][k], v)
+    topology.send_to_server(0, received)
+    assert torch.equal(
+        topology.get_from_worker(0)["parameter"]["weight"], data["parameter"]["weight"]
+    )
+    topology.close()
+
+
+def test_small_data_is_not_moved() -> None:
+    topology = SharedMemoryCentralTopology(
+        mp_context=TorchProcessContext(), worker_num=1
+    )
+    data = {"scale": torch.ones(2)}
+    assert topology._encode(0, data, server_side=True) is data
+    topology.close()
+
+
+def test_segment_reuse() -> None:
+    topology = SharedMemoryCentralTopology(
+        mp_context=TorchProcessContext(), worker_num=1
+    )
+    data = _create_data()
+    message = topology._encode(0, data, server_side=True)
+    assert isinstance(message, _ArenaMessage)
+    received = topology._decode(0, message, server_side=False)
+    # The segment is still used by the received tensors
+    other_message = topology._encode(0, data, server_side=True)
+    assert other_message.segment_name != message.segment_name
+    received_weight = received["parameter"]["weight"]
+    del received
+    gc.collect()
+    new_message = topology._encode(0, data, server_side=True)
+    assert new_message.segment_name != message.segment_name
+    # All tensors of the message must be collected before the segment is reused
+    del received_weight
+    gc.collect()
+    new_message = topology._encode(0, data, server_side=True)
+    assert new_message.segment_name == message.segment_name
+    # The released segment is unmapped on the receiving side
+    mapped_segments = _get_arena()._SharedMemoryArena__mapped_segments
+    assert all(message.segment_name not in v for v in mapped_segments.values())
+    received = topology._decode(0, new_message, server_side=False)
+    topology.close()
+    assert len(mapped_segments) == 0
+    del received
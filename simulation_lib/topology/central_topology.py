@@ -0,0 +1,84 @@
+from typing import Any, Iterable
+
+import gevent.select
+from cyy_naive_lib.topology.central_topology import CentralTopology
+
+from ..message import get_tensor_size
+
+
+class PipeCentralTopology(CentralTopology):
+    def __init__(self, mp_context: Any, worker_num: int) -> None:
+        super().__init__(worker_num=worker_num)
+        # Each pipe is (server end, worker end)
+        self.__pipes: dict = {}
+        for worker_id in range(self.worker_num):
+            self.__pipes[worker_id] = mp_context.create_pipe()
+        # Tensor bytes moved by the server side in this process
+        self.__sent_bytes: int = 0
+        self.__received_bytes: int = 0
+
+    def _encode(self, worker_id: int, data: Any, server_side: bool) -> Any:
+        return data
+
+    def _decode(self, worker_id: int, data: Any, server_side: bool) -> Any:
+        return data
+
+    def get_from_server(self, worker_id: int) -> Any:
+        assert 0 <= worker_id < self.worker_num
+        return self._decode(
+            worker_id, self.__pipes[worker_id][1].recv(), server_side=False
+        )
+
+    def get_from_worker(self, worker_id: int) -> Any:
+        assert 0 <= worker_id < self.worker_num
+        data = self._decode(
+            worker_id, self.__pipes[worker_id][0].recv(), server_side=True
+        )
+        self.__received_bytes += get_tensor_size(data)
+        return data
+
+    def has_data_from_server(self, worker_id: int) -> bool:
+        return self.__pipes[worker_id][1].poll()
+
+    def has_data_from_worker(self, worker_id: int) -> bool:
+        return self.__pipes[worker_id][0].poll()
+
+    def send_to_server(self, worker_id: int, data: Any) -> None:
+        self.__pipes[worker_id][1].send(
+            self._encode(worker_id, data, server_side=False)
+        )
+
+    def send_to_worker(self, worker_id: int, data: Any) -> None:
+        self.__sent_bytes += get_tensor_size(data)
+        self.__pipes[worker_id][0].send(self._encode(worker_id, data, server_side=True))
+
+    def pop_transferred_bytes(self) -> dict:
+        transferred_bytes = {
+            "sent_bytes": self.__sent_bytes,
+            "received_bytes": self.__received_bytes,
+        }
+        self.__sent_bytes = 0
+        self.__received_bytes = 0
+        return transferred_bytes
+
+    def wait_for_worker_data(
+        self, worker_ids: Iterable[int], timeout: float | None = None
+    ) -> set[int]:
+        # select only suspends the calling greenlet, other greenlets keep running
+        fds: dict = {
+            self.__pipes[worker_id][0].fileno(): worker_id for worker_id in worker_ids
+        }
+        readable_fds, _, _ = gevent.select.select(list(fds.keys()), [], [], timeout)
+        return {fds[fd] for fd in readable_fds}
+
+    def wait_for_server_data(
+        self, worker_id: int, timeout: float | None = None
+    ) -> bool:
+        fd = self.__pipes[worker_id][1].fileno()
+        readable_fds, _, _ = gevent.select.select([fd], [], [], timeout)
+        return bool(readable_fds)
+
+    def close(self) -> None:
+        # The pipe ends are shared by many processes, they are released when the
+        # connection objects are collected in each process.
+        pass
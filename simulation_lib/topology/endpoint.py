@@ -0,0 +1,31 @@
+from typing import Any, Iterable
+
+from cyy_naive_lib.topology import cs_endpoint
+
+from .central_topology import PipeCentralTopology
+
+
+class ServerEndpoint(cs_endpoint.ServerEndpoint):
+    def wait_data(
+        self, worker_ids: Iterable[int], timeout: float | None = None
+    ) -> set[int]:
+        assert isinstance(self._topology, PipeCentralTopology)
+        return self._topology.wait_for_worker_data(
+            worker_ids=worker_ids, timeout=timeout
+        )
+
+    def pop_transferred_bytes(self) -> dict:
+        assert isinstance(self._topology, PipeCentralTopology)
+        return self._topology.pop_transferred_bytes()
+
+
+class ClientEndpoint(cs_endpoint.ClientEndpoint):
+    def __init__(self, worker_id: int, **kwargs: Any) -> None:
+        super().__init__(worker_id=worker_id, **kwargs)
+        self.__worker_id: int = worker_id
+
+    def wait_data(self, timeout: float | None = None) -> bool:
+        assert isinstance(self._topology, PipeCentralTopology)
+        return self._topology.wait_for_server_data(
+            worker_id=self.__worker_id, timeout=timeout
+        )
@@ -1,7 +1,6 @@
 from typing import Any, Callable
 
 from cyy_naive_lib.log import get_logger
-from cyy_naive_lib.topology.cs_endpoint import ClientEndpoint, ServerEndpoint
 from cyy_torch_algorithm.quantization.deterministic import (
     NNADQ, NeuralNetworkAdaptiveDeterministicDequant,
     NeuralNetworkAdaptiveDeterministicQuant)
@@ -9,6 +8,7 @@ from cyy_torch_algorithm.quantization.stochastic import stochastic_quantization
 
 from ..message import (DeltaParameterMessage, ParameterMessage,
                        ParameterMessageBase)
+from .endpoint import ClientEndpoint, ServerEndpoint
 
 
 class QuantClientEndpoint(ClientEndpoint):
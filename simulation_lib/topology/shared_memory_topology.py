@@ -0,0 +1,246 @@
+import atexit
+import io
+import os
+import pickle
+import uuid
+import weakref
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any
+
+import numpy
+import torch
+from cyy_naive_lib.log import get_logger
+
+from .central_topology import PipeCentralTopology
+
+# Smaller tensors are pickled inline
+_min_arena_bytes: int = 1024
+_min_segment_bytes: int = 1024 * 1024
+_alignment: int = 64
+
+
+@dataclass
+class _ArenaMessage:
+    segment_name: str
+    # offset, dtype and shape of each tensor in the segment
+    layout: list[tuple[int, torch.dtype, tuple]]
+    payload: bytes
+
+
+class _SharedMemoryArena:
+    # Each message is written into one segment created by the sender, the segment
+    # is reused after the receiver has released all tensors in it
+    def __init__(self) -> None:
+        self.__free_segments: list[shared_memory.SharedMemory] = []
+        self.__used_segments: dict[str, shared_memory.SharedMemory] = {}
+        # Segments created by other processes, by the topology that received them
+        self.__mapped_segments: dict[str, dict[str, shared_memory.SharedMemory]] = {}
+        # Mappings of closed topologies whose tensors were still alive
+        self.__orphaned_segments: list[shared_memory.SharedMemory] = []
+        # The owners of these segments are notified at the next call of the
+        # topology, (worker_id, owned_by_server, segment_name) by topology
+        self.pending_releases: dict[str, list[tuple[int, bool, str]]] = {}
+        atexit.register(self.close)
+
+    def allocate(self, size: int) -> shared_memory.SharedMemory:
+        segment: shared_memory.SharedMemory | None = None
+        for free_segment in self.__free_segments:
+            if free_segment.size >= size and (
+                segment is None or free_segment.size < segment.size
+            ):
+                segment = free_segment
+        if segment is None:
+            # Power-of-two sizes let the segments fit later messages
+            segment = shared_memory.SharedMemory(
+                create=True,
+                size=max(1 << (size - 1).bit_length(), _min_segment_bytes),
+            )
+            get_logger().debug("create shared memory segment of %s", segment.size)
+        else:
+            self.__free_segments.remove(segment)
+        self.__used_segments[segment.name] = segment
+        return segment
+
+    def release(self, segment_name: str) -> None:
+        self.__free_segments.append(self.__used_segments.pop(segment_name))
+
+    def map(self, topology_id: str, segment_name: str) -> shared_memory.SharedMemory:
+        mapped_segments = self.__mapped_segments.setdefault(topology_id, {})
+        if segment_name not in mapped_segments:
+            segment = shared_memory.SharedMemory(name=segment_name)
+            # The creator unlinks the segment, the resource tracker of this process
+            # must not
+            resource_tracker.unregister(segment._name, "shared_memory")
+            mapped_segments[segment_name] = segment
+        return mapped_segments[segment_name]
+
+    def unmap(self, topology_id: str, segment_name: str) -> None:
+        # Only called after all tensors in the segment have been collected
+        self.__mapped_segments[topology_id].pop(segment_name).close()
+
+    def unmap_all(self, topology_id: str) -> None:
+        self.pending_releases.pop(topology_id, None)
+        mapped_segments = self.__mapped_segments.pop(topology_id, {})
+        self.__orphaned_segments.extend(mapped_segments.values())
+        orphaned_segments = self.__orphaned_segments
+        self.__orphaned_segments = []
+        for segment in orphaned_segments:
+            try:
+                segment.close()
+            except BufferError:
+                # Some received tensors are still in use, retry later
+                self.__orphaned_segments.append(segment)
+
+    def close(self) -> None:
+        # Mapped segments may still back tensors, they are unmapped at exit
+        for segment in self.__free_segments + list(self.__used_segments.values()):
+            segment.close()
+            segment.unlink()
+        self.__free_segments.clear()
+        self.__used_segments.clear()
+
+
+_arena: _SharedMemoryArena | None = None
+_arena_pid: int | None = None
+
+
+def _get_arena() -> _SharedMemoryArena:
+    global _arena, _arena_pid
+    if _arena is None or _arena_pid != os.getpid():
+        _arena = _SharedMemoryArena()
+        _arena_pid = os.getpid()
+    return _arena
+
+
+def _to_numpy_dtype(dtype: torch.dtype) -> numpy.dtype:
+    return torch.empty(0, dtype=dtype).numpy().dtype
+
+
+class _ArenaPickler(pickle.Pickler):
+    def __init__(self, file: Any) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.tensors: list[torch.Tensor] = []
+        self.__tensor_indices: dict[int, int] = {}
+
+    def persistent_id(self, obj: Any) -> Any:
+        if not isinstance(obj, torch.Tensor):
+            return None
+        if (
+            obj.device.type != "cpu"
+            or obj.requires_grad
+            or obj.layout != torch.strided
+            or obj.is_quantized
+            or obj.dtype == torch.bfloat16
+            or obj.element_size() * obj.numel() < _min_arena_bytes
+        ):
+            return None
+        if id(obj) not in self.__tensor_indices:
+            self.__tensor_indices[id(obj)] = len(self.tensors)
+            self.tensors.append(obj)
+        return self.__tensor_indices[id(obj)]
+
+
+class _ArenaUnpickler(pickle.Unpickler):
+    def __init__(self, file: Any, tensors: list[torch.Tensor]) -> None:
+        super().__init__(file)
+        self.__tensors = tensors
+
+    def persistent_load(self, pid: Any) -> Any:
+        return self.__tensors[pid]
+
+
+class SharedMemoryCentralTopology(PipeCentralTopology):
+    # Tensors are placed in shared memory and only their positions go through the
+    # pipes, the receivers use them without copying
+    def __init__(self, mp_context: Any, worker_num: int) -> None:
+        super().__init__(mp_context=mp_context, worker_num=worker_num)
+        # Identifies the copies of this topology in all processes, a process may
+        # use several topologies over time
+        self.__id: str = uuid.uuid4().hex
+        # Each pipe is (owner end, receiver end) for the names of released segments
+        self.__server_release_pipes: dict = {}
+        self.__worker_release_pipes: dict = {}
+        for worker_id in range(self.worker_num):
+            self.__server_release_pipes[worker_id] = mp_context.create_pipe()
+            self.__worker_release_pipes[worker_id] = mp_context.create_pipe()
+
+    def __get_release_pipe(self, worker_id: int, owned_by_server: bool) -> tuple:
+        if owned_by_server:
+            return self.__server_release_pipes[worker_id]
+        return self.__worker_release_pipes[worker_id]
+
+    def __flush_releases(self) -> None:
+        arena = _get_arena()
+        releases: dict[tuple[int, bool], list[str]] = {}
+        pending_releases = arena.pending_releases.get(self.__id, [])
+        while pending_releases:
+            worker_id, owned_by_server, segment_name = pending_releases.pop()
+            releases.setdefault((worker_id, owned_by_server), []).append(
+                segment_name
+            )
+        for (worker_id, owned_by_server), segment_names in releases.items():
+            self.__get_release_pipe(worker_id, owned_by_server)[1].send(segment_names)
+            for segment_name in segment_names:
+                arena.unmap(self.__id, segment_name)
+
+    def __collect_releases(self, worker_id: int, server_side: bool) -> None:
+        arena = _get_arena()
+        pipe = self.__get_release_pipe(worker_id, owned_by_server=server_side)[0]
+        while pipe.poll():
+            for segment_name in pipe.recv():
+                arena.release(segment_name)
+
+    def _encode(self, worker_id: int, data: Any, server_side: bool) -> Any:
+        self.__flush_releases()
+        self.__collect_releases(worker_id, server_side)
+        buffer = io.BytesIO()
+        pickler = _ArenaPickler(buffer)
+        pickler.dump(data)
+        if not pickler.tensors:
+            return data
+        layout: list[tuple[int, torch.dtype, tuple]] = []
+        size = 0
+        for tensor in pickler.tensors:
+            layout.append((size, tensor.dtype, tuple(tensor.shape)))
+            size += tensor.element_size() * tensor.numel()
+            size = (size + _alignment - 1) // _alignment * _alignment
+        segment = _get_arena().allocate(size)
+        for tensor, (offset, dtype, shape) in zip(pickler.tensors, layout):
+            numpy.ndarray(
+                shape, dtype=_to_numpy_dtype(dtype), buffer=segment.buf, offset=offset
+            )[...] = tensor.detach().numpy()
+        return _ArenaMessage(
+            segment_name=segment.name, layout=layout, payload=buffer.getvalue()
+        )
+
+    def _decode(self, worker_id: int, data: Any, server_side: bool) -> Any:
+        self.__flush_releases()
+        if not isinstance(data, _ArenaMessage):
+            return data
+        arena = _get_arena()
+        segment = arena.map(self.__id, data.segment_name)
+        # The segment is released when the tensors of the message are collected
+        unreleased_number = [len(data.layout)]
+        pending_releases = arena.pending_releases.setdefault(self.__id, [])
+        release_key = (worker_id, not server_side, data.segment_name)
+
+        def release() -> None:
+            unreleased_number[0] -= 1
+            if unreleased_number[0] == 0:
+                pending_releases.append(release_key)
+
+        tensors: list[torch.Tensor] = []
+        for offset, dtype, shape in data.layout:
+            array = numpy.ndarray(
+                shape, dtype=_to_numpy_dtype(dtype), buffer=segment.buf, offset=offset
+            )
+            weakref.finalize(array, release)
+            tensors.append(torch.from_numpy(array))
+        return _ArenaUnpickler(io.BytesIO(data.payload), tensors).load()
+
+    def close(self) -> None:
+        self.__flush_releases()
+        # Tensors released later are not reported to the owners any more
+        _get_arena().unmap_all(self.__id)
+        super().close()
@@ -1,11 +1,14 @@
+import concurrent.futures
 import copy
 import multiprocessing
 import os
+import threading
 
 # we use these env variables to save memory in large-scale training
 os.environ["CUDA_MODULE_LOADING"] = "LAZY"
 os.environ["USE_THREAD_DATALOADER"] = "1"
 import uuid
+from typing import Any
 
 import gevent
 from cyy_naive_lib.data_structure.process_initialization import \
@@ -17,17 +20,18 @@ from cyy_torch_toolbox.data_structure.torch_process_pool import \
 
 from .algorithm_factory import get_worker_config
 from .config import DistributedTrainingConfig
+from .device_scheduler import DeviceMemoryScheduler
+from .worker.pre_aggregator import PreAggregator
 
 
-def start_server(task_id: int | None, server_config: dict) -> dict:
-    device_lock = get_process_data()["device_lock"]
-    topology = get_process_data()["topology"]
+def start_server(task_id: int | None, server_config: dict, topology: Any) -> dict:
+    device_scheduler = get_process_data()["device_scheduler"]
     get_logger().debug("task_id %s topology id %d", task_id, id(topology))
 
     server = server_config["constructor"](
         extra_kwargs={
             "task_id": task_id,
-            "device_lock": device_lock,
+            "device_scheduler": device_scheduler,
         },
         extra_endpoint_kwargs={
             "topology": topology,
@@ -47,18 +51,25 @@ def start_server(task_id: int | None, server_config: dict) -> dict:
 def start_workers(
     task_id: int | None,
     worker_configs: list[dict],
+    topology: Any,
+    pre_aggregation: bool = False,
 ) -> None:
-    device_lock = get_process_data()["device_lock"]
-    topology = get_process_data()["topology"]
+    device_scheduler = get_process_data()["device_scheduler"]
     workers: list = []
     assert worker_configs
+    pre_aggregator: PreAggregator | None = None
+    if pre_aggregation and len(worker_configs) > 1:
+        pre_aggregator = PreAggregator(
+            worker_ids=[worker_config["worker_id"] for worker_config in worker_configs]
+        )
 
     for worker_config in worker_configs:
         workers.append(
             worker_config["constructor"](
                 extra_kwargs={
                     "task_id": task_id,
-                    "device_lock": device_lock,
+                    "device_scheduler": device_scheduler,
+                    "pre_aggregator": pre_aggregator,
                 },
                 extra_endpoint_kwargs={
                     "topology": topology,
@@ -77,6 +88,61 @@ def start_workers(
 
 tasks: dict = {}
 task_results: dict = {}
+# The process pool shared by the tasks, its processes keep the imported modules
+# and the cached dataset collections between tasks.
+warm_process_pool: TorchProcessPool | None = None
+# The jobs of a task exchange messages, so all of them must run at the same time.
+# A task reserves one process of the warm pool for each job before submitting.
+warm_process_pool_free_slots: int = 0
+warm_process_pool_lock = threading.Lock()
+
+
+def create_process_pool(
+    config: DistributedTrainingConfig, max_workers: int
+) -> TorchProcessPool:
+    device_scheduler = DeviceMemoryScheduler(
+        manager=multiprocessing.Manager(), budget=config.memory_budget
+    )
+    return TorchProcessPool(
+        max_workers=max_workers,
+        initargs=[
+            {
+                "fun_kwargs": {
+                    "device_scheduler": device_scheduler,
+                }
+            }
+        ],
+    )
+
+
+def reserve_warm_process_pool(
+    config: DistributedTrainingConfig, job_number: int
+) -> TorchProcessPool | None:
+    global warm_process_pool
+    global warm_process_pool_free_slots
+    with warm_process_pool_lock:
+        if warm_process_pool is None:
+            max_workers = max(os.cpu_count() or 1, job_number)
+            warm_process_pool = create_process_pool(config, max_workers=max_workers)
+            warm_process_pool_free_slots = max_workers
+        if warm_process_pool_free_slots < job_number:
+            return None
+        warm_process_pool_free_slots -= job_number
+        return warm_process_pool
+
+
+def release_warm_process_pool_slot(_: concurrent.futures.Future) -> None:
+    global warm_process_pool_free_slots
+    with warm_process_pool_lock:
+        warm_process_pool_free_slots += 1
+
+
+def shutdown_warm_process_pool() -> None:
+    global warm_process_pool
+    with warm_process_pool_lock:
+        if warm_process_pool is not None:
+            warm_process_pool.shutdown(wait=True)
+            warm_process_pool = None
 
 
 def train(
@@ -100,34 +166,51 @@ def train(
         task_id = uuid.uuid4().int
     worker_config = get_worker_config(config, practitioners=practitioners)
     topology = worker_config.pop("topology")
-    device_lock = multiprocessing.Manager().RLock()
     assert topology.worker_num == config.worker_number
-    process_pool: TorchProcessPool = TorchProcessPool(
-        initargs=[
-            {
-                "fun_kwargs": {
-                    "device_lock": device_lock,
-                    "topology": topology,
-                }
-            }
-        ],
-    )
+    job_number = len(worker_config["worker"]) + int("server" in worker_config)
+    process_pool: TorchProcessPool | None = None
+    if practitioners is not None:
+        process_pool = reserve_warm_process_pool(config, job_number=job_number)
+        if process_pool is None:
+            get_logger().warning(
+                "the warm process pool is busy, use a new pool for task %s", task_id
+            )
+    use_warm_process_pool = process_pool is not None
+    if process_pool is None:
+        process_pool = create_process_pool(config, max_workers=job_number)
+    futures: list = []
     for worker_configs in worker_config["worker"].values():
-        process_pool.submit(
-            start_workers, task_id=task_id, worker_configs=worker_configs
+        futures.append(
+            process_pool.submit(
+                start_workers,
+                task_id=task_id,
+                worker_configs=worker_configs,
+                topology=topology,
+                pre_aggregation=config.algorithm_kwargs.get("pre_aggregation", False),
+            )
         )
     server_config = worker_config.get("server", None)
     if server_config is not None:
-        process_pool.submit(
-            start_server,
-            task_id=task_id,
-            server_config=server_config,
+        futures.append(
+            process_pool.submit(
+                start_server,
+                task_id=task_id,
+                server_config=server_config,
+                topology=topology,
+            )
         )
+    get_logger().info(
+        "start the training in %s seconds", timer.elapsed_milliseconds() / 1000
+    )
     if practitioners is not None:
+        if use_warm_process_pool:
+            for future in futures:
+                future.add_done_callback(release_warm_process_pool_slot)
         tasks[task_id] = {
-            "process_pool": process_pool,
+            "futures": futures,
             "practitioner_ids": {practitioner.id for practitioner in practitioners},
             "config": config,
+            "process_pool": None if use_warm_process_pool else process_pool,
         }
         task_results[task_id] = {}
         return task_id
@@ -139,15 +222,16 @@ def train(
 
 def get_training_result(task_id: int, timeout: None | float = None) -> None | dict:
     task = tasks[task_id]
-    process_pool = task["process_pool"]
-    results, not_done = process_pool.wait_results(timeout=timeout)
-    for result in results.values():
-        if result is not None:
-            task_results[task_id] |= result
+    _, not_done = concurrent.futures.wait(task["futures"], timeout=timeout)
     if not_done:
         return None
-    process_pool.shutdown()
+    for future in task["futures"]:
+        result = future.result()
+        if result is not None:
+            task_results[task_id] |= result
     tasks.pop(task_id)
+    if task["process_pool"] is not None:
+        task["process_pool"].shutdown(wait=True)
     get_logger().info("finish task %s", task_id)
     stats: dict = {}
     practitioner_ids = task["practitioner_ids"]
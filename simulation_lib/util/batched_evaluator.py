@@ -0,0 +1,96 @@
+from typing import Any, Iterable
+
+import torch
+from cyy_torch_toolbox import DatasetType, TransformType
+from cyy_torch_toolbox.inferencer import Inferencer
+from cyy_torch_toolbox.tensor import tensor_to
+from cyy_torch_toolbox.typing import TensorDict
+
+
+class BatchedEvaluator:
+    # Score several parameter dicts of one model in a single pass over the data, the
+    # parameters are stacked and the model is called through vmap. The batches go
+    # to the model as the dataloader yields them, without the hooks of the
+    # inferencer.
+    def __init__(
+        self, model: torch.nn.Module, dataloader: Iterable, device: torch.device
+    ) -> None:
+        self.__model: torch.nn.Module = model
+        self.__dataloader: Iterable = dataloader
+        self.__device: torch.device = device
+
+    @classmethod
+    def can_evaluate(cls, tester: Inferencer) -> bool:
+        # Only vision collections feed the model with the collated samples, text
+        # and graph models need the input handling of the inferencer. Transforms
+        # of whole batches are applied by the inferencer after the dataloader.
+        if tester.dataset_collection.dataset_type != DatasetType.Vision:
+            return False
+        if tester.hook_config.use_amp:
+            return False
+        transforms = tester.dataset_collection.get_transforms(phase=tester.phase)
+        return not (
+            transforms.get(TransformType.InputBatch)
+            or transforms.get(TransformType.TargetBatch)
+        )
+
+    @classmethod
+    def from_tester(
+        cls,
+        tester: Inferencer,
+        device: torch.device,
+        dataloader: Iterable | None = None,
+    ) -> "BatchedEvaluator":
+        # The dataloader may read a part of the test set of the tester
+        assert cls.can_evaluate(tester)
+        if dataloader is None:
+            dataloader = tester.dataloader
+        return cls(model=tester.model, dataloader=dataloader, device=device)
+
+    @classmethod
+    def __split_batch(cls, batch: Any) -> tuple[Any, torch.Tensor]:
+        match batch:
+            case dict():
+                return batch["input"], batch["target"]
+            case _:
+                return batch[0], batch[1]
+
+    def __call_model(self, parameter: TensorDict, inputs: Any) -> torch.Tensor:
+        return torch.func.functional_call(self.__model, parameter, (inputs,))
+
+    def get_accuracies(self, parameter_dicts: list[TensorDict]) -> list[float]:
+        correct_counts, sample_number = self.get_correct_counts(parameter_dicts)
+        return [count / sample_number for count in correct_counts]
+
+    def get_correct_counts(
+        self, parameter_dicts: list[TensorDict]
+    ) -> tuple[list[int], int]:
+        assert parameter_dicts
+        self.__model.eval()
+        stacked_parameter = {
+            k: torch.stack(
+                [tensor_to(p[k], device=self.__device) for p in parameter_dicts]
+            )
+            for k in parameter_dicts[0]
+        }
+        dtype = next(
+            v.dtype for v in stacked_parameter.values() if v.is_floating_point()
+        )
+        batched_call = torch.vmap(self.__call_model, in_dims=(0, None))
+        correct_counts = torch.zeros(
+            len(parameter_dicts), dtype=torch.long, device=self.__device
+        )
+        sample_number = 0
+        with torch.no_grad():
+            for batch in self.__dataloader:
+                inputs, targets = self.__split_batch(batch)
+                inputs = tensor_to(inputs, device=self.__device, non_blocking=True)
+                # The inferencer converts the inputs to the dtype of the model
+                if isinstance(inputs, torch.Tensor) and inputs.is_floating_point():
+                    inputs = inputs.to(dtype=dtype)
+                targets = targets.to(device=self.__device, non_blocking=True)
+                output = batched_call(stacked_parameter, inputs)
+                correct_counts += (output.argmax(dim=-1) == targets).sum(dim=-1)
+                sample_number += targets.shape[0]
+        assert sample_number > 0
+        return correct_counts.tolist(), sample_number
@@ -0,0 +1,126 @@
+import concurrent.futures
+import json
+import os
+import pickle
+from typing import Any
+
+from cyy_naive_lib.log import get_logger
+
+
+class CheckpointWriter:
+    # Write models and round records on a background thread. There is only one
+    # thread so the writes keep their order.
+    def __init__(
+        self,
+        model_dir: str,
+        save_dir: str,
+        keep_last: int | None = None,
+        keep_every: int | None = None,
+        keep_best: bool = True,
+    ) -> None:
+        self.__model_dir: str = model_dir
+        self.__save_dir: str = save_dir
+        # None keeps every round
+        self.__keep_last: int | None = keep_last
+        self.__keep_every: int | None = keep_every
+        self.__keep_best: bool = keep_best
+        self.__saved_rounds: list[int] = []
+        self.__best_round: int | None = None
+        # Rounds after this one may still become the best round, None means that
+        # all rounds are evaluated
+        self.__evaluated_round: int | None = None
+        self.__executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="checkpoint_writer"
+        )
+        self.__futures: list[concurrent.futures.Future] = []
+
+    def __submit(self, fun: Any, *args: Any) -> None:
+        self.__futures = [future for future in self.__futures if not future.done()]
+        self.__futures.append(self.__executor.submit(fun, *args))
+
+    @classmethod
+    def __dump_pickle(cls, path: str, data: Any) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # readers never see a partial file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def __get_model_path(self, round_number: int) -> str:
+        return os.path.join(self.__model_dir, f"round_{round_number}.pk")
+
+    def __save_model(self, round_number: int, parameter_dict: Any) -> None:
+        self.__dump_pickle(self.__get_model_path(round_number), parameter_dict)
+        self.__saved_rounds.append(round_number)
+        self.__apply_retention()
+
+    def __apply_retention(self) -> None:
+        if self.__keep_last is None and self.__keep_every is None:
+            return
+        kept_rounds: set[int] = set()
+        if self.__keep_last is not None:
+            kept_rounds.update(self.__saved_rounds[-self.__keep_last :])
+        if self.__keep_every is not None:
+            kept_rounds.update(
+                r for r in self.__saved_rounds if r % self.__keep_every == 0
+            )
+        if self.__keep_best and self.__best_round is not None:
+            kept_rounds.add(self.__best_round)
+        if self.__evaluated_round is not None:
+            kept_rounds.update(
+                r for r in self.__saved_rounds if r > self.__evaluated_round
+            )
+        # Only the files saved by this writer are removed
+        for round_number in self.__saved_rounds:
+            if round_number not in kept_rounds:
+                path = self.__get_model_path(round_number)
+                if os.path.isfile(path):
+                    os.remove(path)
+        self.__saved_rounds = [r for r in self.__saved_rounds if r in kept_rounds]
+
+    def save_model(self, round_number: int, parameter_dict: Any) -> None:
+        # The caller must not modify the tensors in place afterwards
+        self.__submit(self.__save_model, round_number, parameter_dict)
+
+    def __set_evaluated_round(self, round_number: int) -> None:
+        self.__evaluated_round = round_number
+        self.__apply_retention()
+
+    def set_evaluated_round(self, round_number: int) -> None:
+        # The models of later rounds are kept until their evaluations finish
+        self.__submit(self.__set_evaluated_round, round_number)
+
+    def __set_best_round(self, round_number: int) -> None:
+        self.__best_round = round_number
+
+    def save_best_model(self, round_number: int, parameter_dict: Any) -> None:
+        self.__submit(self.__set_best_round, round_number)
+        self.__submit(
+            self.__dump_pickle,
+            os.path.join(self.__save_dir, "best_global_model.pk"),
+            parameter_dict,
+        )
+
+    def __append_round_record(self, round_number: int, record: dict) -> None:
+        with open(
+            os.path.join(self.__save_dir, "round_record.jsonl"),
+            "at",
+            encoding="utf8",
+        ) as f:
+            f.write(json.dumps({"round": round_number} | record) + "\n")
+
+    def append_round_record(self, round_number: int, record: dict) -> None:
+        self.__submit(self.__append_round_record, round_number, dict(record))
+
+    def wait(self) -> None:
+        for future in self.__futures:
+            future.result()
+        self.__futures = []
+
+    def close(self) -> None:
+        try:
+            self.wait()
+        finally:
+            self.__executor.shutdown(wait=True)
+        get_logger().debug("checkpoint writer is closed")
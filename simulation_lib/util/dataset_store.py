@@ -0,0 +1,189 @@
+import hashlib
+import importlib.metadata
+import os
+import pickle
+import shutil
+import time
+import uuid
+from typing import Any, Callable
+
+import numpy
+import torch
+from cyy_naive_lib.log import get_logger
+from filelock import FileLock
+
+# Arrays smaller than this are pickled inline
+_min_shared_bytes: int = 1024 * 1024
+# Bumped when the layout of a store changes
+_store_format: int = 1
+# The least recently used stores are removed when the stores take more space
+_default_max_store_bytes: int = 32 * 1024**3
+
+
+def get_dataset_store_dir() -> str:
+    # The stores are kept in ~/.cache/distributed_learning/dataset_store unless the
+    # dataset_store_dir environment variable is set
+    return os.getenv(
+        "dataset_store_dir",
+        os.path.join(
+            os.path.expanduser("~"), ".cache", "distributed_learning", "dataset_store"
+        ),
+    )
+
+
+def _get_library_versions() -> tuple:
+    versions = []
+    for library in ("cyy_torch_toolbox", "torch", "numpy"):
+        try:
+            versions.append((library, importlib.metadata.version(library)))
+        except importlib.metadata.PackageNotFoundError:
+            versions.append((library, None))
+    return (_store_format, pickle.HIGHEST_PROTOCOL, tuple(versions))
+
+
+def _get_dir_bytes(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def clear_dataset_stores(store_dir: str | None = None) -> None:
+    if store_dir is None:
+        store_dir = get_dataset_store_dir()
+    if os.path.isdir(store_dir):
+        get_logger().warning("remove dataset stores in %s", store_dir)
+        shutil.rmtree(store_dir)
+
+
+class _StorePickler(pickle.Pickler):
+    def __init__(self, file: Any, array_dir: str) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__array_dir = array_dir
+        self.__array_names: dict[int, str] = {}
+        # keep the arrays alive so that their ids stay unique
+        self.__arrays: list = []
+
+    def persistent_id(self, obj: Any) -> Any:
+        match obj:
+            case torch.Tensor():
+                if (
+                    obj.requires_grad
+                    or obj.layout != torch.strided
+                    or obj.element_size() * obj.numel() < _min_shared_bytes
+                    or obj.dtype == torch.bfloat16
+                ):
+                    return None
+                return ("tensor", self.__save(obj, obj.detach().cpu().numpy()))
+            case numpy.ndarray():
+                if obj.dtype.hasobject or obj.nbytes < _min_shared_bytes:
+                    return None
+                return ("ndarray", self.__save(obj, obj))
+        return None
+
+    def __save(self, obj: Any, array: numpy.ndarray) -> str:
+        if id(obj) not in self.__array_names:
+            name = f"{len(self.__array_names)}.npy"
+            numpy.save(os.path.join(self.__array_dir, name), array)
+            self.__array_names[id(obj)] = name
+            self.__arrays.append(obj)
+        return self.__array_names[id(obj)]
+
+
+class _StoreUnpickler(pickle.Unpickler):
+    def __init__(self, file: Any, array_dir: str) -> None:
+        super().__init__(file)
+        self.__array_dir = array_dir
+
+    def persistent_load(self, pid: Any) -> Any:
+        kind, name = pid
+        # copy-on-write mapping: every process reads the same page cache and only
+        # pages that are written become private
+        array = numpy.load(os.path.join(self.__array_dir, name), mmap_mode="c")
+        if kind == "tensor":
+            return torch.from_numpy(array)
+        return array
+
+
+class SharedDatasetStore:
+    # The key must describe everything the stored object depends on. It is hashed
+    # together with the versions of the libraries that pickled the object.
+    def __init__(
+        self,
+        key: Any,
+        store_dir: str | None = None,
+        max_store_bytes: int | None = None,
+    ) -> None:
+        if store_dir is None:
+            store_dir = get_dataset_store_dir()
+        if max_store_bytes is None:
+            max_store_bytes = int(
+                os.getenv("dataset_store_max_bytes", str(_default_max_store_bytes))
+            )
+        self.__store_dir: str = store_dir
+        self.__max_store_bytes: int = max_store_bytes
+        self.__dir = os.path.join(
+            store_dir,
+            hashlib.sha256(
+                pickle.dumps((key, _get_library_versions()), protocol=4)
+            ).hexdigest(),
+        )
+
+    def get(self, create_fun: Callable) -> Any:
+        os.makedirs(self.__store_dir, exist_ok=True)
+        built = False
+        # Stores are removed under their locks, so the store can not disappear
+        # between the check and the mapping of its arrays
+        with FileLock(self.__dir + ".lock"):
+            if not os.path.isdir(self.__dir):
+                self.__build(create_fun)
+                built = True
+            # The modification time orders the stores for eviction
+            os.utime(self.__dir)
+            with open(os.path.join(self.__dir, "object.pk"), "rb") as f:
+                obj = _StoreUnpickler(f, array_dir=self.__dir).load()
+        # Eviction takes the locks of other stores, it must not hold this one
+        if built:
+            self.__evict()
+        return obj
+
+    def __build(self, create_fun: Callable) -> None:
+        get_logger().info("build shared dataset store %s", self.__dir)
+        tmp_dir = f"{self.__dir}.{uuid.uuid4()}"
+        os.makedirs(tmp_dir)
+        try:
+            with open(os.path.join(tmp_dir, "object.pk"), "wb") as f:
+                _StorePickler(f, array_dir=tmp_dir).dump(create_fun())
+        except BaseException:
+            shutil.rmtree(tmp_dir)
+            raise
+        os.rename(tmp_dir, self.__dir)
+
+    def __evict(self) -> None:
+        # Remove the least recently used stores other than this one until the
+        # stores fit in the limit. Processes that mapped a removed store keep
+        # their mappings.
+        stores = []
+        for name in os.listdir(self.__store_dir):
+            path = os.path.join(self.__store_dir, name)
+            if os.path.isdir(path) and path != self.__dir and "." not in name:
+                stores.append((os.path.getmtime(path), path))
+        total_bytes = _get_dir_bytes(self.__store_dir)
+        for _, path in sorted(stores):
+            if total_bytes <= self.__max_store_bytes:
+                break
+            with FileLock(path + ".lock"):
+                store_bytes = _get_dir_bytes(path)
+                get_logger().warning(
+                    "remove dataset store %s of %s bytes, it was last used at %s",
+                    path,
+                    store_bytes,
+                    time.ctime(os.path.getmtime(path)),
+                )
+                shutil.rmtree(path)
+            total_bytes -= store_bytes
+
+
+if __name__ == "__main__":
+    clear_dataset_stores()
@@ -0,0 +1,67 @@
+import concurrent.futures
+import itertools
+import multiprocessing
+
+from cyy_naive_lib.log import get_logger
+from cyy_torch_toolbox.device import get_device
+from cyy_torch_toolbox.inferencer import Inferencer
+from cyy_torch_toolbox.ml_type import MachineLearningPhase
+from cyy_torch_toolbox.tensor import tensor_to
+from cyy_torch_toolbox.typing import TensorDict
+
+from ..config import DistributedTrainingConfig
+
+
+def create_tester(config: DistributedTrainingConfig) -> Inferencer:
+    tester = config.create_inferencer(phase=MachineLearningPhase.Test)
+    tester.dataset_collection.remove_dataset(phase=MachineLearningPhase.Training)
+    tester.dataset_collection.remove_dataset(phase=MachineLearningPhase.Validation)
+    tester.hook_config.summarize_executor = False
+    return tester
+
+
+# The tester of an evaluator process
+_tester: Inferencer | None = None
+
+
+def _init_evaluator(config: DistributedTrainingConfig) -> None:
+    global _tester
+    _tester = create_tester(config)
+    _tester.hook_config.log_performance_metric = False
+    _tester.set_device(get_device())
+
+
+def _evaluate(parameter_dict: TensorDict, metric_type: str) -> float:
+    assert _tester is not None
+    _tester.model_util.load_parameter_dict(parameter_dict)
+    _tester.model_util.disable_running_stats()
+    _tester.inference()
+    return _tester.performance_metric.get_epoch_metrics(1)[metric_type]
+
+
+class EvaluatorPool:
+    # Processes that keep the test set loaded and evaluate parameter dicts
+    def __init__(self, config: DistributedTrainingConfig, process_number: int) -> None:
+        get_logger().info("use %s evaluator processes", process_number)
+        self.__executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=process_number,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_evaluator,
+            initargs=(config,),
+        )
+
+    def get_metrics(
+        self, parameter_dicts: list[TensorDict], metric_type: str
+    ) -> list[float]:
+        # The results are in the order of the parameter dicts no matter which
+        # process finishes first
+        return list(
+            self.__executor.map(
+                _evaluate,
+                [tensor_to(p, device="cpu") for p in parameter_dicts],
+                itertools.repeat(metric_type),
+            )
+        )
+
+    def shutdown(self) -> None:
+        self.__executor.shutdown(wait=True)
@@ -19,10 +19,11 @@ class ModelCache:
         self.__parameter_dict = DataStorage(data_path=path)
 
     def cache_parameter_dict(
-        self, parameter_dict: ParameterDictType, path: str
+        self, parameter_dict: ParameterDictType, path: str | None = None
     ) -> None:
         self.__parameter_dict.set_data(tensor_to(parameter_dict, device="cpu"))
-        self.__parameter_dict.set_data_path(path)
+        if path is not None:
+            self.__parameter_dict.set_data_path(path)
 
     # def discard(self) -> None:
     #     self.__parameter_dict.set_data(None)
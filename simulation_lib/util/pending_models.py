@@ -0,0 +1,41 @@
+from typing import Any
+
+
+class PendingModels:
+    # Each worker trains on at most one model at a time. A model of a round closed
+    # while the worker is still busy waits here, and a newer round replaces it, so
+    # a straggler continues with the newest model instead of every missed one.
+    def __init__(self, worker_ids: range, first_round: int) -> None:
+        # The round of the model each worker is training on, None when idle
+        self.__training_rounds: dict[int, int | None] = {
+            worker_id: first_round for worker_id in worker_ids
+        }
+        self.__newest_models: dict[int, tuple[int, Any]] = {}
+
+    def offer(self, worker_id: int, round_number: int, data: Any) -> bool:
+        # Returns whether the model should be sent now
+        if self.__training_rounds[worker_id] is None:
+            self.__training_rounds[worker_id] = round_number
+            self.__newest_models.pop(worker_id, None)
+            return True
+        self.__newest_models[worker_id] = (round_number, data)
+        return False
+
+    def finish(self, worker_id: int) -> int:
+        # Returns the round of the model the worker trained on
+        trained_round = self.__training_rounds[worker_id]
+        assert trained_round is not None
+        self.__training_rounds[worker_id] = None
+        return trained_round
+
+    def pop_newest(self, worker_id: int) -> tuple[int, Any] | None:
+        # The newest model closed while the idle worker was busy, it becomes the
+        # model the worker trains on
+        if (
+            self.__training_rounds[worker_id] is not None
+            or worker_id not in self.__newest_models
+        ):
+            return None
+        round_number, data = self.__newest_models.pop(worker_id)
+        self.__training_rounds[worker_id] = round_number
+        return round_number, data
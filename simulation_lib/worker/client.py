@@ -1,22 +1,29 @@
 from typing import Any
 
-import gevent
-
 from ..executor import ExecutorContext
+from .pre_aggregator import PreAggregator
 from .worker import Worker
 
 
 class Client(Worker):
+    def __init__(
+        self, pre_aggregator: PreAggregator | None = None, **kwargs: Any
+    ) -> None:
+        super().__init__(**kwargs)
+        self._pre_aggregator: PreAggregator | None = pre_aggregator
+
     def send_data_to_server(self, data: Any) -> None:
+        if self._pre_aggregator is not None:
+            # Only the last worker of this process sends the combined update
+            data = self._pre_aggregator.submit(worker_id=self.worker_id, data=data)
+            if data is None:
+                return
         self._endpoint.send(data)
 
     def _get_data_from_server(self) -> Any:
         ExecutorContext.local_data.ctx.release()
         self._release_device_lock()
-        while True:
-            ExecutorContext.local_data.ctx.acquire()
-            if self._endpoint.has_data():
-                break
-            ExecutorContext.local_data.ctx.release()
-            gevent.sleep(0.1)
+        # Only this greenlet is woken when the server writes to our pipe
+        self._endpoint.wait_data()
+        ExecutorContext.local_data.ctx.acquire()
         return self._endpoint.get()
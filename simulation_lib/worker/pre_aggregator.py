@@ -0,0 +1,71 @@
+from typing import Iterable
+
+from cyy_torch_toolbox.tensor import tensor_to
+
+from ..algorithm.parameter_accumulator import ParameterAccumulator
+from ..message import DeltaParameterMessage, Message, ParameterMessage
+
+
+class PreAggregator:
+    # Combine the updates of the workers in this process so that only one weighted
+    # average per round is sent to the server
+    def __init__(self, worker_ids: Iterable[int]) -> None:
+        self.__worker_ids: set[int] = set(worker_ids)
+        self.__submitted_worker_ids: set[int] = set()
+        self.__accumulator: ParameterAccumulator = ParameterAccumulator()
+        self.__first_message: Message | None = None
+        self.__dataset_size: int = 0
+        self.__end_training: bool = False
+
+    def submit(self, worker_id: int, data: Message | None) -> Message | None:
+        # The combined message is returned to the last worker of the round
+        assert worker_id in self.__worker_ids
+        assert worker_id not in self.__submitted_worker_ids
+        self.__submitted_worker_ids.add(worker_id)
+        if data is not None:
+            match data:
+                case DeltaParameterMessage():
+                    parameter = data.delta_parameter
+                case ParameterMessage():
+                    parameter = data.parameter
+                case _:
+                    raise NotImplementedError(data)
+            if self.__first_message is None:
+                self.__first_message = data
+            else:
+                assert type(data) is type(self.__first_message)
+                assert data.other_data == self.__first_message.other_data
+            self.__accumulator.add(
+                tensor_to(parameter, device="cpu"), weight=data.dataset_size
+            )
+            self.__dataset_size += data.dataset_size
+            self.__end_training = self.__end_training or data.end_training
+        if self.__submitted_worker_ids != self.__worker_ids:
+            return None
+        return self.__pop()
+
+    def __pop(self) -> Message:
+        other_data = {"pre_aggregated_worker_ids": sorted(self.__submitted_worker_ids)}
+        self.__submitted_worker_ids = set()
+        first_message = self.__first_message
+        self.__first_message = None
+        if first_message is None:
+            # Every worker skipped this round
+            return Message(other_data=other_data)
+        result: Message
+        match first_message:
+            case DeltaParameterMessage():
+                result = DeltaParameterMessage(
+                    delta_parameter=self.__accumulator.pop(),
+                    dataset_size=self.__dataset_size,
+                )
+            case _:
+                result = ParameterMessage(
+                    parameter=self.__accumulator.pop(),
+                    dataset_size=self.__dataset_size,
+                )
+        result.other_data = first_message.other_data | other_data
+        result.end_training = self.__end_training
+        self.__dataset_size = 0
+        self.__end_training = False
+        return result
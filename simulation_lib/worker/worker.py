@@ -1,15 +1,17 @@
+import json
 import os
 from functools import cached_property
 from typing import Any
 
 import dill
 from cyy_naive_lib.log import get_logger
-from cyy_naive_lib.topology.cs_endpoint import ClientEndpoint
+from cyy_naive_lib.time_counter import TimeCounter
 from cyy_torch_toolbox.ml_type import ExecutorHookPoint
 from cyy_torch_toolbox.trainer import Trainer
 
 from ..executor import Executor
 from ..practitioner import Practitioner
+from ..topology.endpoint import ClientEndpoint
 
 
 class Worker(Executor):
@@ -29,6 +31,8 @@ class Worker(Executor):
         self._endpoint = endpoint
         self._round_num = 0
         self._force_stop = False
+        self.__epoch_counter: TimeCounter | None = None
+        self.__epoch_seconds: list[float] = []
 
     @property
     def worker_id(self):
@@ -44,6 +48,12 @@ class Worker(Executor):
     def _offload_from_device(self) -> None:
         self.trainer.offload_from_device()
 
+    def _get_min_reserved_bytes(self) -> int:
+        # Parameters, gradients and two optimizer states
+        return 4 * sum(
+            p.element_size() * p.numel() for p in self.trainer.model.parameters()
+        )
+
     def _before_training(self) -> None:
         pass
 
@@ -53,6 +63,23 @@ class Worker(Executor):
                 self.trainer.hyper_parameter,
                 f,
             )
+        with open(
+            os.path.join(self.save_dir, "epoch_time.json"), "wt", encoding="utf8"
+        ) as f:
+            json.dump(
+                {
+                    "practitioner_id": self.__practitioner.id,
+                    "epoch_seconds": self.__epoch_seconds,
+                },
+                f,
+            )
+
+    def __start_epoch_counter(self, **kwargs: Any) -> None:
+        self.__epoch_counter = TimeCounter()
+
+    def __record_epoch_time(self, **kwargs: Any) -> None:
+        assert self.__epoch_counter is not None
+        self.__epoch_seconds.append(self.__epoch_counter.elapsed_milliseconds() / 1000)
 
     def _stopped(self) -> bool:
         return self._round_num > self.config.round or self._force_stop
@@ -65,22 +92,28 @@ class Worker(Executor):
             # in case worker changes round number
             with self._get_execution_context():
                 if first_training:
+                    # registered before the aggregation hooks so that the epoch
+                    # time excludes the time waiting for the server
+                    self.trainer.append_named_hook(
+                        ExecutorHookPoint.BEFORE_EPOCH,
+                        "start_epoch_counter",
+                        self.__start_epoch_counter,
+                    )
+                    self.trainer.append_named_hook(
+                        ExecutorHookPoint.AFTER_EPOCH,
+                        "record_epoch_time",
+                        self.__record_epoch_time,
+                    )
                     self._before_training()
                     first_training = False
                     # in case worker changes round number
                     if self._stopped():
                         break
-                    self.trainer.set_device(
-                        device=self._get_device(
-                            lock_callback=lambda: self.trainer.append_named_hook(
-                                ExecutorHookPoint.AFTER_BATCH,
-                                "release_device_lock",
-                                self._release_device_lock,
-                            )
-                        )
-                    )
                 else:
                     self.trainer.hook_config.summarize_executor = False
+                # The memory is reserved for the whole local round and released
+                # when the worker waits for the server
+                self.trainer.set_device(device=self._get_device())
                 self.trainer.disable_hook("batch_loss_logger")
                 self.trainer.set_visualizer_prefix(prefix=f"round: {self._round_num},")
                 self.trainer.train(